@@ -0,0 +1,164 @@
+"""
+Adaptive.py
+
+Samples a property over a grid adaptively, starting coarse and only
+refining the cells where the property isn't well captured by interpolating
+between their corners.
+"""
+
+import numpy as np
+
+class AdaptiveGrid():
+    """A quadtree of cells over the index space of a uniform grid.
+
+    The grid is first covered in square cells whose sides are 2**levels
+    grid steps long, with the property sampled at their corners. Each
+    refinement samples every cell's center and the middle of its edges, and
+    splits the cell into four if any of those differs from bilinear
+    interpolation between the corners by more than half the threshold (or,
+    with a grad_threshold, if the property changes more than grad_threshold
+    per grid step between the corners); both are fractions of the range of
+    the property seen on the coarse grid. Cells one grid step across are
+    never split. The points of a cell that aren't checked may be
+    interpolated worse than those that are, by up to about twice as much
+    for the properties CreateData stores, hence the half: interpolation
+    errors then stay near the threshold, though it is a target and not a
+    bound.
+    Use refine() to sample the property and build the tree
+        resample() to interpolate the property onto the whole uniform grid
+        tree() to get the leaves and samples as arrays, for storing
+        evals to see how many points were sampled
+        leaves for the (ix, iy, size) cells of the tree"""
+
+    def __init__(self, func, nx, ny, levels=4, threshold=0.01,
+                 grad_threshold=None):
+        """Set up a grid to sample
+        Takes:
+            func: returns the property at arrays of x and y grid indices, as
+                an (N,) or (N, k) array
+            nx, ny: number of points along x and y in the uniform grid
+            levels: times the coarsest cells may be halved to reach the grid
+            threshold: interpolation error to keep the grid's points near
+            grad_threshold: largest change allowed per grid step in a cell,
+                if any
+        """
+        self.func = func
+        self.nx = nx
+        self.ny = ny
+        self.levels = levels
+        self.threshold = threshold
+        self.grad_threshold = grad_threshold
+        self.samples = {} # (ix, iy) -> property, at indices on the grid
+        self.leaves = []
+        self.evals = 0
+
+    def _clamp(self, ix, iy):
+        """Move indices past the edge of the grid back onto it; the cells
+        along the far edges may overhang it"""
+        return (np.minimum(ix, self.nx - 1), np.minimum(iy, self.ny - 1))
+
+    def _sample(self, ix, iy):
+        """Sample the property at any of the indices not already sampled"""
+        (ix, iy) = self._clamp(np.asarray(ix).ravel(), np.asarray(iy).ravel())
+        points = set(zip(ix.tolist(), iy.tolist())) - set(self.samples)
+        if len(points) == 0:
+            return
+        (new_x, new_y) = (np.array(p) for p in zip(*sorted(points)))
+        values = np.asarray(self.func(new_x, new_y), dtype=float)
+        values = values.reshape(len(new_x), -1)
+        for (point, value) in zip(zip(new_x.tolist(), new_y.tolist()),
+                                  values):
+            self.samples[point] = value
+        self.evals += len(new_x)
+
+    def _values(self, ix, iy):
+        """Return the sampled property at arrays of indices, as (..., k)"""
+        (ix, iy) = self._clamp(ix, iy)
+        return np.array([self.samples[point] for point in
+                         zip(ix.ravel().tolist(), iy.ravel().tolist())]
+                        ).reshape(ix.shape + (-1,))
+
+    def refine(self):
+        """Sample the property, splitting cells until they all meet the
+        thresholds or are one grid step across"""
+        size = 2**self.levels
+        (ix, iy) = np.meshgrid(np.arange(0, max(self.nx - 1, 1), size),
+                               np.arange(0, max(self.ny - 1, 1), size))
+        (ix, iy) = (ix.ravel(), iy.ravel())
+        corner_x = ix[:, None] + size * np.array([0, 1, 0, 1])
+        corner_y = iy[:, None] + size * np.array([0, 0, 1, 1])
+        self._sample(corner_x, corner_y)
+        values = np.array(self.samples.values())
+        scale = float((values.max(0) - values.min(0)).max()) or 1.0
+        self.leaves = []
+        while len(ix) > 0:
+            if size == 1:
+                self.leaves.extend(zip(ix.tolist(), iy.tolist(),
+                                       [size] * len(ix)))
+                break
+            half = size // 2
+            # Corners, then the center and middle of each edge
+            corner_x = ix[:, None] + size * np.array([0, 1, 0, 1])
+            corner_y = iy[:, None] + size * np.array([0, 0, 1, 1])
+            mid_x = ix[:, None] + half * np.array([1, 1, 0, 2, 1])
+            mid_y = iy[:, None] + half * np.array([1, 0, 1, 1, 2])
+            self._sample(mid_x, mid_y)
+            corners = self._values(corner_x, corner_y)
+            mids = self._values(mid_x, mid_y)
+            interp = np.stack([corners.mean(1),
+                               (corners[:, 0] + corners[:, 1]) / 2,
+                               (corners[:, 0] + corners[:, 2]) / 2,
+                               (corners[:, 1] + corners[:, 3]) / 2,
+                               (corners[:, 2] + corners[:, 3]) / 2], axis=1)
+            error = abs(mids - interp).reshape(len(ix), -1).max(1)
+            split = error > 0.5 * self.threshold * scale
+            if self.grad_threshold is not None:
+                change = (corners.max(1) - corners.min(1)).max(1) / size
+                split |= change > self.grad_threshold * scale
+            # Cells wholly past the edge of the grid are never needed
+            split &= (ix < self.nx - 1) & (iy < self.ny - 1)
+            self.leaves.extend(zip(ix[~split].tolist(), iy[~split].tolist(),
+                                   [size] * int((~split).sum())))
+            (ix, iy) = (ix[split], iy[split])
+            (ix, iy) = ((ix[:, None] + half * np.array([0, 1, 0, 1])).ravel(),
+                        (iy[:, None] + half * np.array([0, 0, 1, 1])).ravel())
+            size = half
+
+    def resample(self):
+        """Return the property at every point of the uniform grid, as an
+        (ny, nx) or (ny, nx, k) array, sampled where it was sampled and
+        interpolated bilinearly within the leaf cells elsewhere"""
+        k = len(self.samples.itervalues().next())
+        grid = np.zeros((self.ny, self.nx, k))
+        # Larger cells first, so that finer neighbors overwrite shared edges
+        leaves = np.array(self.leaves, dtype=int).reshape(-1, 3)
+        for size in sorted(set(leaves[:, 2]), reverse=True):
+            (ix, iy) = leaves[leaves[:, 2] == size, :2].T
+            corners = self._values(ix[:, None] + size * np.array([0, 1, 0, 1]),
+                                   iy[:, None] + size * np.array([0, 0, 1, 1]))
+            frac = np.arange(size + 1) / float(size)
+            (u, v) = (frac[None, :, None], frac[:, None, None])
+            values = ((1 - u) * (1 - v) * corners[:, None, None, 0] +
+                      u * (1 - v) * corners[:, None, None, 1] +
+                      (1 - u) * v * corners[:, None, None, 2] +
+                      u * v * corners[:, None, None, 3])
+            point_x = ix[:, None, None] + np.arange(size + 1)[None, None, :]
+            point_y = iy[:, None, None] + np.arange(size + 1)[None, :, None]
+            (point_x, point_y) = np.broadcast_arrays(point_x, point_y)
+            inside = (point_x < self.nx) & (point_y < self.ny)
+            grid[point_y[inside], point_x[inside]] = values[inside]
+        for ((ix, iy), value) in self.samples.items():
+            grid[iy, ix] = value
+        if k == 1:
+            return grid[:, :, 0]
+        return grid
+
+    def tree(self):
+        """Return the leaves as an (M, 3) array of (ix, iy, size) cells and
+        the samples as an (S, 2 + k) array of ix, iy and the property there,
+        in index order"""
+        points = sorted(self.samples)
+        leaves = np.array(self.leaves, dtype=int).reshape(-1, 3)
+        samples = np.column_stack((np.array(points, dtype=int).reshape(-1, 2),
+                                   [self.samples[point] for point in points]))
+        return (leaves, samples)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Benchmark.py
+
+Times the single point queries an event driven simulator makes of a
+crossbridge, one force or rate at a time, using the scalar minimizer, and
+checks them against their latency targets.
+"""
+
+import sys
+import time
+import getopt
+import numpy as np
+import numpy.random as random
+import Crossbridge
+
+
+__help_message__ = '''
+Times single point queries with the scalar minimizer, exiting with 1 if any
+misses its latency target:
+Option                Values         Results
+-h, --help                           You see this message
+-x, --crossbridge     1,2,4          Times only the given crossbridge type
+-n, --number          Interger       How many head locations to time over,
+                                       200 by default
+'''
+
+
+# Per call latency targets in microseconds, with the minimize_energy cache
+# off so that every call searches, for one core of a ~3 GHz machine. The
+# four spring crossbridge takes about 3.5 Newton iterations per search, r23
+# two searches; the others need no search at all.
+__targets__ = {
+    4: {'force': 150, 'free_energy': 150, 'r23': 300, 'r31': 150},
+    2: {'force': 15, 'free_energy': 15, 'r23': 15, 'r31': 15},
+    1: {'force': 15, 'free_energy': 15, 'r23': 15, 'r31': 15}}
+
+
+class Usage(Exception):
+    """Passes mesages back to the command line"""
+    def __init__(self, msg):
+        self.msg = msg
+
+
+def time_queries(xb, h_locs, repeats=3):
+    """Return the best of repeats mean per call times, in microseconds, of
+    force, free_energy (both tightly bound), r23 and r31 over h_locs"""
+    h_locs = [(float(x), float(y)) for (x, y) in h_locs]
+    queries = {'force': lambda h_loc: xb.force(h_loc, 3),
+               'free_energy': lambda h_loc: xb.free_energy(h_loc, 3),
+               'r23': xb.r23,
+               'r31': xb.r31}
+    latencies = {}
+    for name, query in queries.items():
+        best = None
+        for i in range(repeats):
+            tic = time.time()
+            for h_loc in h_locs:
+                query(h_loc)
+            took = (time.time() - tic) / len(h_locs)
+            best = took if best is None else min(best, took)
+        latencies[name] = 1e6 * best
+    return latencies
+
+def agreement(xb, h_locs):
+    """Return the largest difference in energy between the scalar minima
+    and those of minimize_energy_batch over h_locs, across the states"""
+    worst = 0.0
+    for state in (1, 2, 3):
+        batch = xb.minimize_energy_batch(h_locs, state)[0]
+        scalar = [xb.minimize_energy(h_loc, state)[0] for h_loc in h_locs]
+        worst = max(worst, float(abs(np.subtract(scalar, batch)).max()))
+    return worst
+
+
+def main(argv=None):
+    """Parse options, time the queries and check their targets"""
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hx:n:",
+                                       ["help", "crossbridge=", "number="])
+        except getopt.error, msg:
+            raise Usage(msg)
+        # Default values, retained for non-passed options
+        xbtypes = [4, 2, 1]
+        number = 200
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(__help_message__)
+            elif option in ("-x", "--crossbridge"):
+                if value in ("1", "2", "4"):
+                    xbtypes = [int(value)]
+                else:
+                    raise Usage("Allowed xb types are 1, 2 and 4 (spring)")
+            elif option in ("-n", "--number"):
+                number = int(value)
+        # Head locations over the CreateData grid
+        random.seed(0)
+        h_locs = np.column_stack((random.uniform(0, 20, number),
+                                  random.uniform(10, 20, number)))
+        missed = []
+        for xbtype in xbtypes:
+            xb = {4: Crossbridge.FourSpring, 2: Crossbridge.TwoSpring,
+                  1: Crossbridge.OneSpring}[xbtype](minimizer='scalar',
+                                                    cache_size=0)
+            latencies = time_queries(xb, h_locs)
+            print (str(xbtype) + " spring, energies within " +
+                   str(agreement(xb, h_locs)) + " RT of the batch minima")
+            for name in sorted(latencies):
+                target = __targets__[xbtype][name]
+                met = latencies[name] <= target
+                print ("    %-12s %8.1f us   target %5d us   %s" %
+                       (name, latencies[name], target,
+                        "met" if met else "MISSED"))
+                if not met:
+                    missed.append(str(xbtype) + " spring " + name)
+        if len(missed) > 0:
+            print "Missed targets: " + ", ".join(missed)
+            return 1
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
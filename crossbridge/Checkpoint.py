@@ -0,0 +1,126 @@
+"""
+Checkpoint.py
+
+Keeps the rows of each property finished so far during a CreateData run on
+disk, so that a run killed part way through can be resumed where it left off.
+"""
+
+import os
+import shutil
+import hashlib
+import warnings
+import cPickle as pickle
+import numpy as np
+import numpy.random as random
+
+class Checkpoint():
+    """Interface with the partial results of an interrupted run.
+
+    Finished chunks of grid rows are kept, one .npy file per chunk, in a
+    <n>spring.ckpt (or <n>spring.<tag>.ckpt) directory next to the Storage
+    file. A manifest in that directory records a fingerprint of the run's
+    parameters and the seed the Monte Carlo rows are drawn with, so resumed
+    runs reproduce exactly the values an uninterrupted one would have.
+    Use rows(xb_property, n_rows) to see what has been finished
+        write_rows(xb_property, start, new_values) to keep a finished chunk
+        clear() to throw the lot away once the results are safely stored"""
+
+    def __init__(self, xbtype, params, seed=None, resume=False, tag=None):
+        """Open the checkpoint for a run, starting a new one unless resuming
+        Takes:
+            xbtype: number of springs, names the checkpoint directory
+            params: anything that changes the values calculated, such as the
+                config, ranges and trials; compared by fingerprint on resume
+            seed: seed for the Monte Carlo rows, chosen at random if None
+            resume: if True, keep whatever a previous run with the same
+                params finished, otherwise start from scratch
+            tag: names the checkpoint apart from others for the same xbtype,
+                so runs making different properties at once don't collide
+        """
+        if tag is None:
+            self.dir_name = str(xbtype) + "spring.ckpt"
+        else:
+            self.dir_name = str(xbtype) + "spring." + str(tag) + ".ckpt"
+        self.manifest_name = os.path.join(self.dir_name, "manifest.pkl")
+        self.fingerprint = fingerprint(params)
+        manifest = None
+        if resume:
+            try:
+                stream = open(self.manifest_name, 'rb')
+                manifest = pickle.load(stream)
+                stream.close()
+            except IOError: # Nothing to resume from
+                msg = ("\n Checkpoint " + self.dir_name +
+                " not found, starting from scratch")
+                warnings.warn(msg)
+        if manifest is not None and manifest['fingerprint'] != self.fingerprint:
+            msg = ("\n Parameters have changed since the checkpoint was "
+                   "made, trashing it and starting anew")
+            warnings.warn(msg)
+            manifest = None
+        if manifest is not None and seed is not None and \
+           seed != manifest['seed']:
+            warnings.warn("\n Resuming with the checkpoint's seed, " +
+                          str(manifest['seed']) + ", not the one passed")
+        if manifest is None:
+            if seed is None:
+                seed = int(random.randint(2**31 - 1))
+            manifest = {'fingerprint': self.fingerprint, 'seed': seed}
+            self.clear()
+            os.mkdir(self.dir_name)
+            stream = open(self.manifest_name, 'wb')
+            pickle.dump(manifest, stream)
+            stream.close()
+        self.seed = manifest['seed']
+
+    def rows(self, xb_property, n_rows):
+        """Return a boolean mask of the n_rows rows of a property that are
+        finished, and a dict of the finished chunks' values keyed by the
+        index of their first row"""
+        done = np.zeros(n_rows, dtype=bool)
+        chunks = {}
+        prefix = xb_property + "."
+        for file_name in os.listdir(self.dir_name):
+            if not (file_name.startswith(prefix) and
+                    file_name.endswith(".npy")):
+                continue
+            start = file_name[len(prefix):-len(".npy")]
+            if not start.isdigit():
+                continue
+            chunks[int(start)] = np.load(os.path.join(self.dir_name,
+                                                      file_name))
+            done[int(start):int(start)+len(chunks[int(start)])] = True
+        return (done, chunks)
+
+    def write_rows(self, xb_property, start, new_values):
+        """Keep a finished chunk of rows, starting at row start, on disk.
+        The chunk is written to a temporary file and renamed into place, so
+        a run killed mid write never leaves a partial chunk behind"""
+        file_name = os.path.join(self.dir_name,
+                                 xb_property + "." + str(start) + ".npy")
+        stream = open(file_name + ".tmp", 'wb')
+        np.save(stream, np.asarray(new_values))
+        stream.close()
+        os.rename(file_name + ".tmp", file_name)
+
+    def clear(self):
+        """Throw away the checkpoint directory and all it holds"""
+        if os.path.isdir(self.dir_name):
+            shutil.rmtree(self.dir_name)
+
+
+def fingerprint(params):
+    """A hex digest identifying a set of run parameters, which may nest
+    dicts, lists and tuples; dicts are compared irrespective of key order"""
+    return hashlib.sha1(repr(_canonical(params))).hexdigest()
+
+def _canonical(params):
+    """Put params into a form whose repr doesn't depend on dict ordering"""
+    if isinstance(params, dict):
+        return tuple(sorted((repr(key), _canonical(val))
+                            for key, val in params.items()))
+    elif isinstance(params, (list, tuple)):
+        return tuple(_canonical(val) for val in params)
+    elif isinstance(params, (float, np.floating)):
+        return repr(float(params))
+    return params
@@ -6,12 +6,18 @@ Created by Dave Williams on 2009-07-01.
 """
 
 import Storage
+import Checkpoint
+import ResultCache
+import Adaptive
+import Kinetics
 import Crossbridge
 import warnings
 import sys
 import time
 import getopt
+import multiprocessing
 import numpy as np
+import numpy.random as random
 from numpy import pi, radians
 
 
@@ -21,12 +27,35 @@ Option                Values         Results
 -h, --help                           You see this message
 -x, --crossbridge     1,2,4          Picks number of springs to emulate
 -t, --trials          Interger       How many trials for each r12 point
+-r, --r12             mc, exact      Monte Carlo r12 trials or noise-free 
+                                       r12 from the head position density
 -p, --property        Some strs      No value chooses all props, some value
                                        selects a given property
+-j, --jobs            Interger       How many processes to spread rows over
+-a, --refine          Float          Refines a coarse grid only where
+                                       needed to keep interpolation errors
+                                       near this fraction of a property's
+                                       range, storing the sampled cells
+                                       as <property>.leaves and .samples
+-s, --seed            Interger       Seeds the Monte Carlo r12 trials
+--resume              Exists or not  Picks up an interrupted run from its 
+                                       checkpoint
+--cache               Directory      Where finished properties are cached,
+                                       xbcache by default
+--cache-size          Megabytes      How big the cache may grow, 2048 MB by 
+                                       default
+--no-cache            Exists or not  Neither reads nor fills the cache
 -d, --defaults        Exists or not  Chooses all default values       
 '''
 
 
+__checkpoint_rows__ = 10 # Rows per chunk kept by a single process
+__seed_stride__ = 4 # Rows apart of those solved cold to seed their neighbors
+__version__ = 2 # Of the values computed here, kept in the result cache keys
+                # and stores; bump it whenever a change alters any of them,
+                # so that values made before aren't reused
+
+
 class Usage(Exception):
     """Passes mesages back to the command line"""
     def __init__(self, msg):
@@ -40,16 +69,24 @@ def main(argv=None):
         argv = sys.argv
     try:
         try:
-            short_opts = "hx:t:p:d"
-            long_opts = ["help" , "crossbridge=", 
-                         "trials=", "property=", "defaults"]
+            short_opts = "hx:t:r:p:j:s:a:d"
+            long_opts = ["help" , "crossbridge=", "trials=", "r12=", 
+                         "property=", "jobs=", "seed=", "refine=", "resume",
+                         "cache=", "cache-size=", "no-cache", "defaults"]
             opts, args = getopt.getopt(argv[1:], short_opts, long_opts)
         except getopt.error, msg:
             raise Usage(msg)
         # Default values, retained for non-passed options
         xbtype = 4
         trials = 10
+        r12_type = 'r12' # Monte Carlo, or 'r12_exact'
         prop_to_gen = None # Triggers generation of all properties
+        jobs = 1
+        seed = None # Drawn at random, unless resuming
+        resume = False
+        refine_threshold = None # Samples the full grid
+        cache_dir = "xbcache" # None skips the cache
+        cache_size = 2048 # MB
         # option processing
         if len(opts) == 0:
             raise Usage(__help_message__)
@@ -63,8 +100,27 @@ def main(argv=None):
                     raise Usage("Allowed xb types are 1, 2 and 4 (spring)")
             elif option in ("-t", "--trials"):
                 trials = int(value)
+            elif option in ("-r", "--r12"):
+                if value in ("mc", "exact"):
+                    r12_type = {"mc": 'r12', "exact": 'r12_exact'}[value]
+                else:
+                    raise Usage("Allowed r12 methods are mc and exact")
             elif option in ("-p", "--property"):
                 prop_to_gen = value
+            elif option in ("-j", "--jobs"):
+                jobs = int(value)
+            elif option in ("-s", "--seed"):
+                seed = int(value)
+            elif option in ("-a", "--refine"):
+                refine_threshold = float(value)
+            elif option == "--resume":
+                resume = True
+            elif option == "--cache":
+                cache_dir = value
+            elif option == "--cache-size":
+                cache_size = float(value)
+            elif option == "--no-cache":
+                cache_dir = None
             elif option in ("-d", "--defaults"):
                 print("Using default values")
             else:
@@ -163,64 +219,166 @@ def main(argv=None):
             }
             xb = Crossbridge.OneSpring(config)
         # Make or load a place to store results
-        store = Storage.Storage(xbtype, config, x_range, d10_range)
+        store = Storage.Storage(xbtype, config, x_range, d10_range, "npy")
+        # Keep finished rows on disk as we go, or pick up where we left off
+        ckpt = Checkpoint.Checkpoint(xbtype, [config, x_range, y_range, 
+                                              trials, r12_type, prop_to_gen, 
+                                              refine_threshold,
+                                              xb.minimizer,
+                                              __version__],
+                                     seed, resume, 
+                                     prop_to_gen)
+        # Properties made before, under any config, may be in the cache
+        if cache_dir is not None:
+            cache = ResultCache.ResultCache(cache_dir, 
+                                            int(cache_size * 2**20))
+        # Crossbridges needing no minimization have every property but r12 
+        # worked out over the whole grid at once, quicker than any lookup
+        closed = {}
+        if xb.closed_form and prop_to_gen != 'r12':
+            closed = xb.deterministic_grid(np.arange(*x_range), 
+                                           np.arange(*y_range))
+        calculated = []
+        quadtrees = {} # Leaves and samples of adaptively refined properties
+        def calc(name, val_type, **kwargs):
+            """Fetch a property from the cache, or calculate and cache it; 
+            all properties are calculated over the same grid and processes
+            """
+            calculated.append(name)
+            if name in closed:
+                return closed[name].tolist()
+            tree_keys = []
+            if cache_dir is not None:
+                if val_type == 'r12': # Monte Carlo
+                    key = cache.key(xbtype, config, x_range, y_range, 
+                                    val_type, xb.minimizer, __version__,
+                                    trials, ckpt.seed)
+                else:
+                    key = cache.key(xbtype, config, x_range, y_range,
+                                    val_type if name == 'r12' else name,
+                                    xb.minimizer, __version__,
+                                    threshold=refine_threshold)
+                    if refine_threshold is not None and name != 'r12':
+                        tree_keys = [cache.key(xbtype, config, x_range,
+                                               y_range, name + part,
+                                               xb.minimizer, __version__,
+                                               threshold=refine_threshold)
+                                     for part in ('.leaves', '.samples')]
+                new_vals = cache.get(key)
+                tree = tuple(cache.get(tree_key) for tree_key in tree_keys)
+                if new_vals is not None and all(part is not None
+                                                for part in tree):
+                    if len(tree) > 0:
+                        quadtrees[name] = tree
+                    return new_vals.tolist()
+            # Only work out the points missing from a regridded store
+            known = None
+            if name in store.partial and (name != 'r12' or (
+                    _stored(store, 'trials') == trials and
+                    _stored(store, 'seed') == ckpt.seed)) and (
+                    _stored_version(store, name) == __version__):
+                known = store.get(name)
+            new_vals = calc_values(xb, x_range, y_range, val_type, 
+                                   jobs=jobs, seed=ckpt.seed, 
+                                   checkpoint=ckpt, prop_name=name, 
+                                   known=known,
+                                   refine_threshold=refine_threshold,
+                                   quadtrees=quadtrees, **kwargs)
+            if cache_dir is not None:
+                cache.put(key, new_vals)
+                for (tree_key, part) in zip(tree_keys,
+                                            quadtrees.get(name, ())):
+                    cache.put(tree_key, part)
+            return new_vals
         # Generate some properties, or all of them
         if prop_to_gen is None:
             runing_tic = time.time()
             print "Calculating energies... "
-            energy = calc_values(xb, x_range, y_range, 'energy', state=1)
-            free_e = calc_values(xb, x_range, y_range, 'free_energy', state=2)
-            post_e = calc_values(xb, x_range, y_range, 'free_energy', state=3)
+            # State 2 converter locations seed the other states' searches
+            conv2 = calc('min_conv2', 'min_conv', state=2)
+            energy = calc('energy', 'energy', state=1, guess=conv2)
+            free_e = calc('free_energy', 'free_energy', state=2, guess=conv2)
+            conv3 = calc('min_conv3', 'min_conv', state=3, guess=conv2)
+            post_e = calc('post_energy', 'free_energy', state=3, guess=conv3)
             print "done. Took " + str(time.time()-runing_tic) + " seconds."
             runing_tic = time.time()
             print "Calculating binding rate... "
-            r12 = calc_values(xb, x_range, y_range, 'r12', trials = trials)
+            r12 = calc('r12', r12_type, trials = trials)
             print "done. Took " + str(time.time()-runing_tic) + " seconds."
             runing_tic = time.time()
             print "Calculating all other values... "
-            r23 = calc_values(xb, x_range, y_range, 'r23')
-            r31 = calc_values(xb, x_range, y_range, 'r31')
-            force1 = calc_values(xb, x_range, y_range, 'force', state=1)
-            force2 = calc_values(xb, x_range, y_range, 'force', state=2)
-            force3 = calc_values(xb, x_range, y_range, 'force', state=3)
+            r23 = calc('r23', 'r23')
+            r31 = calc('r31', 'r31')
+            force1 = calc('force1', 'force', state=1, guess=conv2)
+            force2 = calc('force2', 'force', state=2, guess=conv2)
+            force3 = calc('force3', 'force', state=3, guess=conv3)
             print "done. Took " + str(time.time()-runing_tic) + " seconds."
             runing_tic = time.time()
             print "Storing output, will exit when done."
+            store.write('min_conv2', conv2)
+            store.write('min_conv3', conv3)
             store.write('energy', energy)
             store.write('free_energy', free_e)
             store.write('post_energy', post_e)
             store.write('r12', r12)
-            store.write('trials', trials)
+            store.write('trials', trials if r12_type == 'r12' else None)
+            store.write('seed', ckpt.seed if r12_type == 'r12' else None)
+            store.write('adaptive', None if closed else refine_threshold)
             store.write('r23', r23)
             store.write('r31', r31)
             store.write('force1', force1)
             store.write('force2', force2)
             store.write('force3', force3)
+            store.write('versions', dict((name, __version__)
+                                         for name in calculated))
         else:
-            prop_gen_func = {
+            prop_gen_funcs = {
                 'energy': lambda:
-                calc_values(xb, x_range, y_range, 'energy', state=1), 
+                calc('energy', 'energy', state=1), 
                 'free_energy': lambda:
-                calc_values(xb, x_range, y_range, 'free_energy', state=2), 
+                calc('free_energy', 'free_energy', state=2), 
                 'post_energy': lambda:
-                calc_values(xb, x_range, y_range, 'free_energy', state=3),
+                calc('post_energy', 'free_energy', state=3),
                 'r12': lambda:
-                calc_values(xb, x_range, y_range, 'r12', trials = trials),
+                calc('r12', r12_type, trials = trials),
                 'r23': lambda:
-                calc_values(xb, x_range, y_range, 'r23'),
+                calc('r23', 'r23'),
                 'r31': lambda:
-                calc_values(xb, x_range, y_range, 'r31'),
+                calc('r31', 'r31'),
                 'force1': lambda:
-                calc_values(xb, x_range, y_range, 'force', state=1),
+                calc('force1', 'force', state=1),
                 'force2': lambda:
-                calc_values(xb, x_range, y_range, 'force', state=2),
+                calc('force2', 'force', state=2),
                 'force3': lambda:
-                calc_values(xb, x_range, y_range, 'force', state=3)
-            }[prop_to_gen]
-            prop_vals = prop_gen_func()
+                calc('force3', 'force', state=3)
+            }
+            prop_vals = prop_gen_funcs[prop_to_gen]()
+            stale = [prop for prop in sorted(prop_gen_funcs.keys() +
+                                             ['min_conv2', 'min_conv3'])
+                     if prop != prop_to_gen and prop in store.list() and
+                     _stored_version(store, prop) != __version__]
+            if len(stale) > 0:
+                warnings.warn("Stored properties made by an older version, "
+                              "which should be remade: " + ", ".join(stale))
             store.write(prop_to_gen, prop_vals)
-        # Save results to disk
+            if prop_to_gen == 'r12':
+                store.write('trials', trials if r12_type == 'r12' else None)
+                store.write('seed', ckpt.seed if r12_type == 'r12' else None)
+            versions = dict(_stored(store, 'versions', {}))
+            versions[prop_to_gen] = __version__
+            store.write('versions', versions)
+        # Keep the quadtrees of refined properties, clearing out old ones
+        for name in calculated:
+            if name in quadtrees or name + '.leaves' in store.list():
+                (leaves, samples) = quadtrees.get(name, (None, None))
+                store.write(name + '.leaves', leaves)
+                store.write(name + '.samples', samples)
+        # Steady state occupancies, and what follows from them, once the
+        # rates, energies and forces are all in hand
+        Kinetics.write_properties(store)
+        # Save results to disk, after which the checkpoint isn't needed
         store.save()
+        ckpt.clear()
         print "The whole thing took " + str(time.time()-tic) + " seconds."
         
     except Usage, err:
@@ -229,26 +387,258 @@ def main(argv=None):
         return 2
     
 
-def calc_values(xb_inst, x_r, y_r, val_type, state =1, trials =1):
-    """Calculate values and return them"""
+def calc_values(xb_inst, x_r, y_r, val_type, state =1, trials =1, 
+                guess =None, jobs =1, seed =None, checkpoint =None, 
+                prop_name =None, known =None, refine_threshold =None,
+                quadtrees =None):
+    """Calculate values and return them
+    
+    Energy and force values may be warm started by passing guess, a 
+    [[row1], [row2], ...] grid of converter locations such as the 'min_conv' 
+    values of a related state; without one, the rows of each chunk are
+    seeded from a few solved from rest (see _row_seeds). With more than one
+    job the grid rows are split into chunks and farmed out to a pool of
+    local processes, each of which rebuilds the crossbridge from its spec
+    (see xb_spec).
+    Passing a seed draws each Monte Carlo row from its own stream, seeded 
+    from the seed and the row's index, so the values don't depend on how 
+    the rows are chunked or which process calculates them; the points
+    filling in known values draw from streams of their own, so they don't
+    replay the draws of the points already known. Passing a 
+    Checkpoint keeps each chunk on disk under prop_name as it is finished, 
+    and skips any chunks it already holds. Passing known, a grid of values 
+    with NaNs where they are still needed (as Storage leaves them after a 
+    range change), only calculates those points; the exact r12 is cheap 
+    enough to always be calculated across the whole grid.
+    Passing refine_threshold samples the property on an
+    Adaptive.AdaptiveGrid instead, refining a coarse grid only where
+    needed to keep interpolation errors near refine_threshold of the
+    property's range, and interpolates the rest of the grid from those
+    samples; passing quadtrees, a dict, keeps the grid's leaves and samples
+    in it under prop_name (see Adaptive.AdaptiveGrid.tree). This is done in
+    one process, without checkpoints or known values, and not for r12, as
+    the Monte Carlo noise would be refined down to the full grid and the
+    exact r12 is cheap.
+    """
     x_locs = np.arange(x_r[0], x_r[1], x_r[2]) 
     y_locs = np.arange(y_r[0], y_r[1], y_r[2])
-    # Select the value to generate with a dict and some lambdas
-    try:
-        value_gen_func = {
-            'energy': lambda x, y: xb_inst.minimize_energy((x,y), state)[0], 
-            'free_energy': lambda x, y: xb_inst.free_energy((x,y), state), 
-            'r12': lambda x, y: xb_inst.r12((x,y), trials),
-            'r23': lambda x, y: xb_inst.r23((x,y)),
-            'r31': lambda x, y: xb_inst.r31((x,y)),
-            'force': lambda x, y: xb_inst.force((x,y), state)
-        }[val_type]
-    except KeyError:
+    if val_type not in ('energy', 'min_conv', 'free_energy', 'r12', 
+                        'r12_exact', 'r23', 'r31', 'force'):
         warnings.warn("Invalid value type, can't calculate request values")
         return
-    # Create the new values in format [[row1], [row2], ...]
-    new_vals = [[value_gen_func(x, y) for x in x_locs] for y in y_locs]
-    return new_vals
+    if guess is not None:
+        guess = np.reshape(guess, (y_locs.size, x_locs.size, 2))
+    if (refine_threshold is not None and
+            val_type not in ('r12', 'r12_exact')):
+        def sample(x_index, y_index):
+            """Values at grid points, warm started from their guesses"""
+            return _value_func(xb_inst, val_type, state, trials, 
+                               None if guess is None else 
+                               guess[y_index, x_index], x_locs, y_locs)(
+                np.column_stack((x_locs[x_index], y_locs[y_index])))
+        grid = Adaptive.AdaptiveGrid(sample, x_locs.size, y_locs.size,
+                                     threshold=refine_threshold)
+        grid.refine()
+        if quadtrees is not None:
+            quadtrees[prop_name] = grid.tree()
+        return grid.resample().tolist()
+    # Preallocate the results, [[row1], [row2], ...]
+    if val_type in ('min_conv', 'force'):
+        new_vals = np.zeros((y_locs.size, x_locs.size, 2))
+    else:
+        new_vals = np.zeros((y_locs.size, x_locs.size))
+    # Fill in whatever an earlier run already finished
+    done = np.zeros(y_locs.size, dtype=bool)
+    if val_type == 'r12_exact':
+        known = None
+    if known is not None:
+        new_vals[:] = np.reshape(known, new_vals.shape)
+        done = ~np.isnan(new_vals).reshape(y_locs.size, -1).any(axis=1)
+    if checkpoint is not None:
+        (ckpt_done, chunks) = checkpoint.rows(prop_name, y_locs.size)
+        done |= ckpt_done
+        for start, vals in chunks.items():
+            new_vals[start:start+len(vals)] = vals
+    # The exact r12 convolves the whole grid at once, so isn't split up
+    if val_type == 'r12_exact':
+        chunk_rows = y_locs.size
+    elif jobs > 1:
+        chunk_rows = int(np.ceil(y_locs.size / (4.0 * jobs)))
+    elif checkpoint is not None:
+        chunk_rows = __checkpoint_rows__
+    else:
+        chunk_rows = y_locs.size
+    # Chunk up each run of unfinished rows
+    tasks = []
+    start = 0
+    while start < y_locs.size:
+        if done[start]:
+            start += 1
+            continue
+        stop = start + 1
+        while (stop < y_locs.size and not done[stop] and 
+               stop - start < chunk_rows):
+            stop += 1
+        tasks.append((start, val_type, state, trials, seed, x_locs, 
+                      y_locs[start:stop], y_locs,
+                      None if guess is None else guess[start:stop], 
+                      new_vals[start:stop] if known is not None else None))
+        start = stop
+    if jobs == 1 or len(tasks) <= 1:
+        results = (_calc_rows(xb_inst, task) for task in tasks)
+    else:
+        pool = multiprocessing.Pool(jobs, _init_worker, (xb_spec(xb_inst),))
+        results = pool.imap_unordered(_calc_rows_worker, tasks)
+    for start, vals in results:
+        new_vals[start:start+len(vals)] = vals
+        if checkpoint is not None:
+            checkpoint.write_rows(prop_name, start, vals)
+    if jobs > 1 and len(tasks) > 1:
+        pool.close()
+        pool.join()
+    return new_vals.tolist()
+
+def _calc_rows(xb_inst, task):
+    """Calculate the values for a chunk of grid rows, returning the index of 
+    the chunk's first row and a (rows, x_locs.size, ...) array of values; 
+    if the chunk comes with known values only their NaNs are calculated"""
+    (start, val_type, state, trials, seed, x_locs, y_locs, grid_y_locs,
+     guess, known) = task
+    # All grid locations as an (N, 2) array, running along each row in turn
+    x_grid, y_grid = np.meshgrid(x_locs, y_locs)
+    h_locs = np.column_stack((x_grid.ravel(), y_grid.ravel()))
+    rows = np.repeat(np.arange(len(y_locs)), len(x_locs))
+    if known is None:
+        missing = np.ones(len(h_locs), dtype=bool)
+    else:
+        missing = np.isnan(known).reshape(len(h_locs), -1).any(axis=1)
+        h_locs = h_locs[missing]
+        rows = rows[missing]
+    if (guess is None and known is None and not xb_inst.closed_form and
+            val_type in ('energy', 'min_conv', 'free_energy', 'force')):
+        guess = _row_seeds(xb_inst, state, x_locs, grid_y_locs, start,
+                           start + len(y_locs))
+    if guess is not None:
+        guess = np.reshape(guess, (-1, 2))[missing]
+    value_gen_func = _value_func(xb_inst, val_type, state, trials, guess, 
+                                 x_locs, y_locs)
+    if val_type == 'r12' and seed is not None:
+        # Reproducible draws, whichever chunk or process the row lands in,
+        # with a marker for the points filling gaps among known ones
+        new_vals = np.zeros(len(h_locs))
+        for row in np.unique(rows):
+            random.seed([seed, start + row] + ([] if known is None else [1]))
+            row_locs = (rows == row)
+            new_vals[row_locs] = value_gen_func(h_locs[row_locs])
+    else:
+        new_vals = value_gen_func(h_locs)
+    if known is not None:
+        chunk_vals = np.array(known, dtype=float)
+        chunk_vals.reshape(len(missing), -1)[missing] = \
+            new_vals.reshape(len(new_vals), -1)
+        return (start, chunk_vals)
+    return (start, new_vals.reshape(y_grid.shape + new_vals.shape[1:]))
+
+def _row_seeds(xb_inst, state, x_locs, y_locs, start, stop):
+    """Return an (N, 2) guess at the converter location of every point of
+    the grid rows start to stop, in the order of _calc_rows: every
+    __seed_stride__th row of the whole grid is solved from the rest
+    converter location, in one batch, and each row takes the solutions of
+    the nearest of those, whether or not it lies in the chunk, so that the
+    guesses don't depend on how the rows are chunked. Neighboring rows are
+    0.1 nm apart on the CreateData grid, so this saves about a third of the
+    Newton iterations of starting every point from rest, for one extra
+    batch of a quarter of the points; seeding each row from the one before
+    saves more iterations, but the row by row batches cost more than that
+    """
+    last_seed = (len(y_locs) - 1) // __seed_stride__ * __seed_stride__
+    nearest = np.minimum(np.round(np.arange(start, stop) /
+                                  float(__seed_stride__)).astype(int) *
+                         __seed_stride__, last_seed)
+    seed_rows = np.unique(nearest)
+    x_grid, y_grid = np.meshgrid(x_locs, y_locs[seed_rows])
+    convs = xb_inst.minimize_energy_batch(
+        np.column_stack((x_grid.ravel(), y_grid.ravel())), state)[1]
+    return convs.reshape(len(seed_rows), len(x_locs), 2)[
+        np.searchsorted(seed_rows, nearest)]
+
+def _value_func(xb_inst, val_type, state, trials, guess, x_locs, y_locs):
+    """Return a function giving the values at an (N, 2) array of head 
+    locations, from the (N, 2) guess if one is given"""
+    # Select the value to generate with a dict and some lambdas
+    return {
+        'energy': lambda h: 
+            xb_inst.minimize_energy_batch(h, state, guess)[0], 
+        'min_conv': lambda h: 
+            xb_inst.minimize_energy_batch(h, state, guess)[1], 
+        'free_energy': lambda h: 
+            xb_inst.free_energy_batch(h, state, guess), 
+        'r12': lambda h: xb_inst.r12_batch(h, trials),
+        'r12_exact': lambda h: 
+            xb_inst.r12_exact_grid(x_locs, y_locs).ravel(),
+        'r23': lambda h: xb_inst.r23_batch(h),
+        'r31': lambda h: xb_inst.r31_batch(h),
+        'force': lambda h: xb_inst.force_batch(h, state, guess)
+    }[val_type]
+
+def xb_spec(xb_inst):
+    """A lightweight, picklable description of a crossbridge to rebuild"""
+    return (xb_inst.__class__.__name__, xb_inst.config, xb_inst.minimizer)
+
+def _init_worker(spec):
+    """Build the crossbridge a pool process works with, and give the process 
+    its own random stream rather than a copy of its parent's"""
+    global _worker_xb
+    (class_name, config, minimizer) = spec
+    _worker_xb = getattr(Crossbridge, class_name)(config, minimizer)
+    random.seed()
+
+def _calc_rows_worker(task):
+    """Calculate a chunk of grid rows with this process's crossbridge"""
+    return _calc_rows(_worker_xb, task)
+
+def sweep_minimize(xb_inst, x_locs, y_locs, state, guess =None):
+    """Minimize the energy at each grid location one point at a time, 
+    for callers of the scalar minimize_energy.
+    
+    The grid is walked in a serpentine order, along the first row, back 
+    along the second, and so on, so that each point is seeded with the 
+    solution of the neighbor just before it. If a guess grid of converter 
+    locations is passed (e.g. a state 2 solution when solving state 3), it 
+    seeds each point instead. 
+    Takes:
+        xb_inst: the crossbridge to minimize
+        x_locs, y_locs: the grid locations
+        state: state of the cross-bridge, 1, 2, or 3
+        guess: optional (y_locs.size, x_locs.size, 2) array of converter locs
+    Returns:
+        energy: (y_locs.size, x_locs.size) array of minimum energies
+        c_locs: (y_locs.size, x_locs.size, 2) array of converter locations
+    """
+    energy = np.zeros((y_locs.size, x_locs.size))
+    c_locs = np.zeros((y_locs.size, x_locs.size, 2))
+    prev_conv = None
+    for yit in range(y_locs.size):
+        x_order = range(x_locs.size)
+        if yit % 2 == 1:
+            x_order.reverse()
+        for xit in x_order:
+            seed = prev_conv if guess is None else guess[yit, xit]
+            energy[yit, xit], c_locs[yit, xit] = xb_inst.minimize_energy(
+                (x_locs[xit], y_locs[yit]), state, seed)
+            prev_conv = c_locs[yit, xit]
+    return energy, c_locs
+
+def _stored(store, xb_property, default=None):
+    """Return a stored property, or default if the store hasn't got it"""
+    if xb_property in store.list():
+        return store.get(xb_property)
+    return default
+
+def _stored_version(store, xb_property):
+    """Return the __version__ a stored property was made by, 0 if it was
+    made before versions were recorded"""
+    return _stored(store, 'versions', {}).get(xb_property, 0)
 
 def fil_sep_to_d10(face_to_face):
     """Convert filament seperation values from filament-face-to-filament face
@@ -271,5 +661,10 @@ def fil_sep_to_d10(face_to_face):
     cent_to_cent = face_to_face + 6.90
     return (1.5 * cent_to_cent)
 
+def d10_to_fil_sep(d10):
+    """Convert d10 values back to filament face to face separations, undoing
+    fil_sep_to_d10, as for reading grids out of Storage"""
+    return (d10 / 1.5) - 6.90
+
 if __name__ == "__main__":
     sys.exit(main())
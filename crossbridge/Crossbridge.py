@@ -18,14 +18,108 @@ linear or torsional springs. A schematic follows::
 """
 
 import warnings
+from collections import OrderedDict
+import numpy as np
 import numpy.random as random
+from numpy.polynomial.hermite_e import hermegauss
 from scipy.optimize import fmin_bfgs as fmin
+from scipy.signal import fftconvolve
+from scipy.special import log_ndtr
 from numpy import pi, sqrt, log
 import math as m
 
 
+# Solver info for cross-bridges whose minimum needs no search
+_NO_SEARCH_INFO = {'converged': True, 'iterations': 0, 'fevals': 1, 
+                   'gevals': 0, 'restarted': False}
+
+
+def _as_locs(locs):
+    """Coerce a location or a sequence of locations to an (N, 2) array"""
+    return np.asarray(locs, dtype=float).reshape(-1, 2)
+
+
+def _bop_nodes(springs, order):
+    """Gauss-Hermite quadrature over the bopped values of some springs
+    
+    Each spring's bopped value is normal about its weak rest value (see 
+    Spring.bop), so a tensor product of probabilists' Gauss-Hermite rules 
+    averages smooth functions of those values as the Monte Carlo draws 
+    would, but without the noise.
+    Takes:
+        springs: list of Springs that are bopped
+        order: number of quadrature nodes per spring
+    Returns:
+        vals: list of arrays of spring values, one per spring
+        weights: array of quadrature weights, summing to one
+    """
+    (nodes, weights) = hermegauss(order)
+    weights = weights / weights.sum()
+    node_grids = np.meshgrid(*([nodes] * len(springs)), indexing='ij')
+    weight_grids = np.meshgrid(*([weights] * len(springs)), indexing='ij')
+    vals = [spring.weak + spring.stand_dev * grid.ravel() 
+            for spring, grid in zip(springs, node_grids)]
+    return (vals, np.prod([grid.ravel() for grid in weight_grids], axis=0))
+
+
+def _grid_steps(x_locs, y_locs):
+    """The spacing of an evenly spaced grid, either axis may be a point"""
+    d_x = x_locs[1] - x_locs[0] if np.size(x_locs) > 1 else None
+    d_y = y_locs[1] - y_locs[0] if np.size(y_locs) > 1 else None
+    return (d_x or d_y or 0.1, d_y or d_x or 0.1)
+
+
+def _cell_area(x_locs, y_locs):
+    """The area of each cell of an evenly spaced grid"""
+    (d_x, d_y) = _grid_steps(x_locs, y_locs)
+    return d_x * d_y
+
+
+def _r23_rate(state2_energy, state3_energy):
+    """The r23 rate from the loosely and tightly bound energies"""
+    return .1 * (1 + np.tanh(.4 * (state2_energy - state3_energy)+4))+.001
+
+
+def _r31_rate(state3_energy):
+    """The r31 rate from the tightly bound energy"""
+    return np.sqrt(.01 * state3_energy) + 0.02
+
+
+def _newton_steps(grads, hessians):
+    """Return descent steps for stacks of 2D gradients and Hessians
+    
+    Hessians that aren't comfortably positive definite have their diagonal 
+    shifted until they are, so every returned step points downhill.
+    Takes:
+        grads: (N, 2) array of gradients
+        hessians: (N, 2, 2) array of Hessians
+    Returns:
+        steps: (N, 2) array of (modified) Newton steps
+    """
+    h_xx = hessians[:, 0, 0]
+    h_xy = hessians[:, 0, 1]
+    h_yy = hessians[:, 1, 1]
+    half_tr = 0.5 * (h_xx + h_yy)
+    det = h_xx * h_yy - h_xy**2
+    min_eig = half_tr - np.sqrt(np.maximum(half_tr**2 - det, 0))
+    floor = 1e-3 * (np.abs(h_xx) + np.abs(h_yy)) + 1e-8
+    shift = np.where(min_eig < floor, floor - min_eig, 0)
+    h_xx = h_xx + shift
+    h_yy = h_yy + shift
+    det = h_xx * h_yy - h_xy**2
+    step_x = -(h_yy * grads[:, 0] - h_xy * grads[:, 1]) / det
+    step_y = -(h_xx * grads[:, 1] - h_xy * grads[:, 0]) / det
+    return np.column_stack((step_x, step_y))
+
+
 class Spring(object):
-    """A generic spring that handles some accounting"""
+    """A generic spring that handles some accounting
+    
+    Changing weak, strong or k updates the spread of the spring's bopped 
+    values and the SpringBlock of the crossbridge the spring belongs to.
+    """
+    __slots__ = ('_weak', '_strong', '_k', 'normalize', 'stand_dev', 'block')
+    
     def __init__(self, spring_config):
         """Create the spring with a set of passed values
         
@@ -37,16 +131,39 @@ class Spring(object):
         Returns: 
             None
         """
-        self.weak = spring_config['weak']
-        self.strong = spring_config['strong']
-        self.k = spring_config['spring_konstant']
+        self.block = None
+        self._weak = spring_config['weak']
+        self._strong = spring_config['strong']
+        self._k = spring_config['spring_konstant']
+        self._changed()
+    
+    def _changed(self):
+        """Rework the values that follow from the spring's own"""
         # Diffusion related
         temperature = 288 # in K
         boltzman = 1.381 * 10**-23 # Boltzman const (in J/K)
         k_t = boltzman * temperature * 10**21  # kT without pN/nM conversion
         # Normalize is a factor used to normalize the PDF of the segment vals
-        self.normalize = sqrt(2*pi*k_t/self.k)
-        self.stand_dev = sqrt(k_t/self.k) # of seg vals
+        self.normalize = sqrt(2*pi*k_t/self._k)
+        self.stand_dev = sqrt(k_t/self._k) # of seg vals
+        if self.block is not None:
+            self.block.update()
+    
+    def _set_weak(self, value):
+        self._weak = value
+        self._changed()
+    
+    def _set_strong(self, value):
+        self._strong = value
+        self._changed()
+    
+    def _set_k(self, value):
+        self._k = value
+        self._changed()
+    
+    weak = property(lambda self: self._weak, _set_weak)
+    strong = property(lambda self: self._strong, _set_strong)
+    k = property(lambda self: self._k, _set_k)
     
     def rest(self, state):
         """Return the rest value of the spring at in a given state
@@ -57,25 +174,26 @@ class Spring(object):
             None
         """
         if state in [1, 2]:
-            return self.weak
+            return self._weak
         elif state == 3:
-            return self.strong
+            return self._strong
         else:
             warnings.warn("Improper value for spring state")
     
     def energy(self, curr_val, state):
         """Given a current value, return the energy the spring stores"""
         if state in [1, 2]:
-            return (0.5 * self.k * m.pow((curr_val-self.weak), 2))
+            return (0.5 * self._k * m.pow((curr_val-self._weak), 2))
         elif state == 3:
-            return (0.5 * self.k * m.pow((curr_val-self.strong), 2))
+            return (0.5 * self._k * m.pow((curr_val-self._strong), 2))
         else:
             warnings.warn("Improper value for spring state")
     
-    def bop(self):
+    def bop(self, size=None):
         """Bop the xb to a new location, based on an exponential distribution 
         of energies for each independent segment of the crossbridge as 
-        determined by Boltzmann's law. Return the new head location.
+        determined by Boltzmann's law. Return the new head location, or an 
+        array of the given size of independently bopped locations.
             
         Justification of technique
         --------------------------
@@ -130,11 +248,50 @@ class Spring(object):
         We can customize this for each spring with which we deal with by 
         plugging in their own means and spring constants.
         """
-        return (random.normal(self.weak, self.stand_dev))
+        return (random.normal(self.weak, self.stand_dev, size))
+    
+
+class SpringBlock(object):
+    """The values of a crossbridge's T, N, C and G springs, gathered up for 
+    the energy evaluations at the heart of every minimization
+    
+    Rather than asking each Spring for its rest value in a state, and so 
+    testing the state every time, the energy paths index into tuples of 
+    plain floats made here: k holds the four spring constants and rests the 
+    four rest values by state (1, 2 or 3, with rests[0] None), and 
+    rest_convs the rest converter location in each state. The springs keep 
+    the block up to date whenever one of their values is changed.
+    """
+    __slots__ = ('springs', 'k', 'rests', 'rest_convs', 'key')
+    
+    def __init__(self, springs):
+        """Gather up the (t, n, c, g) springs, and claim them"""
+        self.springs = tuple(springs)
+        for spring in self.springs:
+            spring.block = self
+        self.update()
+    
+    def update(self):
+        """Rework the gathered values from the springs' current ones"""
+        self.k = tuple(float(spring.k) for spring in self.springs)
+        weak = tuple(float(spring.weak) for spring in self.springs)
+        strong = tuple(float(spring.strong) for spring in self.springs)
+        self.rests = (None, weak, weak, strong)
+        self.rest_convs = (None,) + tuple(
+            (rests[1] * m.cos(rests[0]), rests[1] * m.sin(rests[0])) 
+            for rests in self.rests[1:])
+        self.key = tuple((spring.weak, spring.strong, spring.k) 
+                         for spring in self.springs)
     
 
 class Crossbridge(object):
-    def __init__(self, config = None):
+    minimizers = ('bfgs', 'bfgs_numeric', 'newton', 'spring', 'scalar')
+    warm_jump = 1.0 # nm a warm started converter may move in the same basin
+    cache_quantum = 1e-6 # nm, head locations closer than this share a cache
+    bind_reach = 6.0 # nm beyond which bind_prob is at its far field floor
+    closed_form = False # True where minimize_energy needs no search
+    
+    def __init__(self, config = None, minimizer = 'bfgs', cache_size = 4096):
         """A generic cross-bridge, a TNCG one by default
         
         This cross-bridge class provides default functionality, such
@@ -150,6 +307,8 @@ class Crossbridge(object):
                  'C': ...
                  'G': ... 
                 }
+            minimizer: the backend minimize_energy uses, one of minimizers
+            cache_size: entries in the minimize_energy cache, 0 to disable
         """
         # Eventually, take out default config, put in GenerateData
         if config == None:
@@ -181,35 +340,484 @@ class Crossbridge(object):
         self.n = Spring(self.config['N'])
         self.c = Spring(self.config['C'])
         self.g = Spring(self.config['G'])
+        self.springs = SpringBlock((self.t, self.n, self.c, self.g))
+        if minimizer not in self.minimizers:
+            raise ValueError("Unknown minimizer, use one of " + 
+                             ", ".join(self.minimizers))
+        self.minimizer = minimizer
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_fingerprint = None
+        self.cache_hits = 0
+        self.cache_misses = 0
     
-    def minimize_energy(self, h_loc, state):
+    def minimize_energy(self, h_loc, state, guess=None, full_output=False):
         """The cross-bridge's minimum energy for a given head location, state
         
+        The search is run by the backend named in self.minimizer:
+            bfgs: BFGS on the converter location with an analytic gradient
+            bfgs_numeric: BFGS with a finite difference gradient
+            newton: damped Newton with an analytic Hessian, as in
+                minimize_energy_batch
+            spring: BFGS in spring coordinates, the T angle and N length 
+                scaled by the square roots of their spring constants, so 
+                stiff and soft springs are equally well conditioned
+            scalar: the damped Newton steps of newton, taken in plain 
+                floats without NumPy or SciPy, for callers asking after one 
+                location at a time (see Benchmark.py)
+        The search starts from the rest converter location unless a guess 
+        is given. A warm start that fails to converge or ends up more than 
+        warm_jump from its guess has likely slid into another basin and is 
+        replaced by a search from the rest location.
+        Results are memoized in a per-instance LRU cache of cache_size 
+        entries, keyed on the head location (to within cache_quantum nm), 
+        the state and the spring fingerprint, so the repeated searches made 
+        by free_energy, force, r23 and r31 at one location are only run 
+        once. The cache empties itself when any spring value is changed; 
+        see cache_info.
         Takes:
             h_loc:  [x,y] location of the cross-bridge tip
             state: state of the cross-bridge, 1, 2, or 3
+            guess: [x,y] converter location to start the search from, such 
+                as the solution at a neighboring head location
+            full_output: if True, also return a dictionary of solver info
         Returns:
             energy: cross-bridge's minimum energy 
-            min_conv: [x,y] converter location yielding the minimum energy 
+            min_conv: [x,y] converter location yielding the minimum energy,
+                as an array from every backend (the single location methods
+                below use _minimum, which keeps it as the backend left it)
+            info: (if full_output) a dictionary holding 
+                converged: True if the backend converged
+                iterations: iterations the backend took
+                fevals: number of energy evaluations
+                gevals: number of gradient evaluations
+                restarted: True if a warm start was abandoned for a cold one
+            (cached results report no iterations or evaluations)
+        """
+        (energy, min_conv, info) = self._minimum(h_loc, state, guess,
+                                                 full_output)
+        if full_output:
+            return (energy, np.array(min_conv), dict(info))
+        return (energy, np.array(min_conv))
+    
+    def _minimum(self, h_loc, state, guess=None, full_output=False):
+        """The (energy, min_conv, info) of minimize_energy, with min_conv
+        as the backend or cache left it, a tuple of floats from the scalar
+        backend; info only has its cached counts zeroed if full_output"""
+        if self.cache_size <= 0:
+            result = self._minimize_energy(h_loc, state, guess)
+        else:
+            fingerprint = self.fingerprint()
+            if fingerprint != self._cache_fingerprint:
+                self._cache.clear()
+                self._cache_fingerprint = fingerprint
+            key = (int(round(h_loc[0] / self.cache_quantum)), 
+                   int(round(h_loc[1] / self.cache_quantum)), state)
+            result = self._cache.pop(key, None)
+            if result is None:
+                self.cache_misses += 1
+                result = self._minimize_energy(h_loc, state, guess)
+                if len(self._cache) >= self.cache_size:
+                    self._cache.popitem(last=False)
+                self._cache[key] = result
+            else:
+                self.cache_hits += 1
+                self._cache[key] = result
+                if full_output:
+                    result = (result[0], result[1], 
+                              dict(result[2], iterations=0, fevals=0, 
+                                   gevals=0))
+        return result
+    
+    def _minimize_energy(self, h_loc, state, guess):
+        """Search for the minimum energy as described in minimize_energy"""
+        rest_conv_loc = self.springs.rest_convs[state]
+        if self.minimizer == 'newton':
+            (energy, min_conv, info) = self.minimize_energy_batch(
+                [h_loc], state, guess=guess, full_output=True)
+            (energy, min_conv) = (float(energy[0]), min_conv[0])
+            info = dict((key, val[0]) for key, val in info.items())
+        else:
+            start_conv = rest_conv_loc if guess is None else guess
+            if self.minimizer == 'spring':
+                (energy, min_conv, info) = self._minimize_spring_coords(
+                    h_loc, state, start_conv)
+            elif self.minimizer == 'scalar':
+                (energy, min_conv, info) = self._newton_scalar(
+                    float(h_loc[0]), float(h_loc[1]), 
+                    float(start_conv[0]), float(start_conv[1]), state)
+            else:
+                fprime = {'bfgs': self.energy_grad, 'bfgs_numeric': None}
+                (min_conv, energy, grad, hess_inv, fevals, gevals, warnflag, 
+                 all_vecs) = fmin(self.energy, start_conv, 
+                                  fprime=fprime[self.minimizer], 
+                                  args=(h_loc, state), disp=0, 
+                                  full_output=1, retall=1)
+                info = {'converged': warnflag == 0, 
+                        'iterations': len(all_vecs) - 1, 
+                        'fevals': fevals, 'gevals': gevals}
+            info['restarted'] = False
+            if guess is not None and (not info['converged'] or 
+                    m.hypot(min_conv[0] - guess[0], 
+                            min_conv[1] - guess[1]) > self.warm_jump):
+                (energy, min_conv, cold_info) = self._minimize_energy(
+                    h_loc, state, None)
+                for key in ('iterations', 'fevals', 'gevals'):
+                    cold_info[key] += info[key]
+                info = cold_info
+                info['restarted'] = True
+        return (energy, tuple(min_conv), info)
+    
+    def fingerprint(self):
+        """Return a hashable summary of the springs and minimizer in use"""
+        return self.springs.key + (self.minimizer,)
+    
+    def cache_info(self):
+        """Report the state of the minimize_energy cache"""
+        return {'hits': self.cache_hits, 'misses': self.cache_misses, 
+                'maxsize': self.cache_size, 'currsize': len(self._cache)}
+    
+    def cache_clear(self):
+        """Empty the minimize_energy cache and reset its counters"""
+        self._cache.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
+    
+    def _minimize_spring_coords(self, h_loc, state, start_conv):
+        """Run BFGS over the scaled T angle and N length, see minimize_energy
+        """
+        (t_rest, n_rest) = self.springs.rests[state][:2]
+        (t_scale, n_scale) = (1 / sqrt(self.t.k), 1 / sqrt(self.n.k))
+        def conv(spring_loc):
+            t_ang = t_rest + t_scale * spring_loc[0]
+            n_len = n_rest + n_scale * spring_loc[1]
+            return (n_len * m.cos(t_ang), n_len * m.sin(t_ang), t_ang, n_len)
+        def energy(spring_loc):
+            return self.energy(conv(spring_loc)[:2], h_loc, state)
+        def grad(spring_loc):
+            (x, y, t_ang, n_len) = conv(spring_loc)
+            d_conv = self.energy_grad((x, y), h_loc, state)
+            return np.array([t_scale * (-y * d_conv[0] + x * d_conv[1]), 
+                             n_scale * (m.cos(t_ang) * d_conv[0] + 
+                                        m.sin(t_ang) * d_conv[1])])
+        (min_loc, energy, d_loc, hess_inv, fevals, gevals, warnflag, 
+         all_vecs) = fmin(energy, 
+                          ((m.atan2(start_conv[1], start_conv[0]) - t_rest) / 
+                           t_scale, 
+                           (m.hypot(start_conv[0], start_conv[1]) - n_rest) / 
+                           n_scale), 
+                          fprime=grad, disp=0, full_output=1, retall=1)
+        info = {'converged': warnflag == 0, 'iterations': len(all_vecs) - 1, 
+                'fevals': fevals, 'gevals': gevals}
+        return (energy, np.array(conv(min_loc)[:2]), info)
+    
+    def _newton_scalar(self, h_x, h_y, x, y, state, gtol=1e-6, max_iter=50):
+        """Run the damped Newton iterations of _newton_batch for one head 
+        location, all in plain floats, starting from the converter at (x, y)
         """
-        rest_conv_loc = (self.n.rest(state) * m.cos(self.t.rest(state)),
-                         self.n.rest(state) * m.sin(self.t.rest(state)))
-        min_conv = fmin(self.energy, 
-            rest_conv_loc, args = (h_loc, state), disp=0)
-        return (self.energy(min_conv, h_loc, state), min_conv)
+        energy_derivs = self._energy_derivs_scalar
+        (energy, g_x, g_y, h_xx, h_xy, h_yy) = energy_derivs(x, y, h_x, h_y, 
+                                                             state)
+        (iterations, fevals) = (0, 1)
+        while max(abs(g_x), abs(g_y)) > gtol and iterations < max_iter:
+            # The modified Newton step of _newton_steps
+            half_tr = 0.5 * (h_xx + h_yy)
+            det = h_xx * h_yy - h_xy * h_xy
+            min_eig = half_tr - m.sqrt(max(half_tr * half_tr - det, 0.0))
+            floor = 1e-3 * (abs(h_xx) + abs(h_yy)) + 1e-8
+            if min_eig < floor:
+                (h_xx, h_yy) = (h_xx + floor - min_eig, h_yy + floor - min_eig)
+                det = h_xx * h_yy - h_xy * h_xy
+            step_x = -(h_yy * g_x - h_xy * g_y) / det
+            step_y = -(h_xx * g_y - h_xy * g_x) / det
+            # Backtrack until the step gives sufficient decrease
+            slope = g_x * step_x + g_y * step_y
+            alpha = 1.0
+            trial = self._energy_scalar(x + step_x, y + step_y, h_x, h_y, 
+                                        state)
+            fevals += 1
+            for j in xrange(30):
+                if not trial > energy + 1e-4 * alpha * slope:
+                    break
+                alpha *= 0.5
+                trial = self._energy_scalar(x + alpha * step_x, 
+                                            y + alpha * step_y, h_x, h_y, 
+                                            state)
+                fevals += 1
+            (x, y) = (x + alpha * step_x, y + alpha * step_y)
+            (energy, g_x, g_y, h_xx, h_xy, h_yy) = energy_derivs(x, y, h_x, 
+                                                                 h_y, state)
+            iterations += 1
+            fevals += 1
+            # A step that no longer moves the converter is as good as it gets
+            if max(abs(alpha * step_x), abs(alpha * step_y)) < 1e-12:
+                break
+        info = {'converged': max(abs(g_x), abs(g_y)) <= gtol, 
+                'iterations': iterations, 'fevals': fevals, 
+                'gevals': iterations + 1}
+        return (energy, (x, y), info)
+    
+    def _energy_scalar(self, x, y, h_x, h_y, state):
+        """The energy with the converter at (x, y) and head at (h_x, h_y), 
+        as energy gives it but taking and returning plain floats"""
+        (t_k, n_k, c_k, g_k) = self.springs.k
+        (t_s, n_s, c_s, g_s) = self.springs.rests[state]
+        t_ang = m.atan2(y, x)
+        (d_x, d_y) = (h_x - x, h_y - y)
+        t_off = t_ang - t_s
+        n_off = m.hypot(x, y) - n_s
+        c_off = m.atan2(d_y, d_x) + m.pi - t_ang - c_s
+        g_off = m.hypot(d_x, d_y) - g_s
+        return 0.5 * (t_k * t_off * t_off + n_k * n_off * n_off + 
+                      c_k * c_off * c_off + g_k * g_off * g_off)
+    
+    def _energy_derivs_scalar(self, x, y, h_x, h_y, state):
+        """The energy, its gradient (g_x, g_y) and Hessian (h_xx, h_xy, 
+        h_yy) with respect to the converter location, as plain floats, 
+        written out from energy_derivs_batch"""
+        (t_k, n_k, c_k, g_k) = self.springs.k
+        (t_s, n_s, c_s, g_s) = self.springs.rests[state]
+        d_x = h_x - x
+        d_y = h_y - y
+        t_ang = m.atan2(y, x)
+        n_sq = x * x + y * y
+        g_sq = d_x * d_x + d_y * d_y
+        n_len = m.sqrt(n_sq)
+        g_len = m.sqrt(g_sq)
+        # Strains, and the strains scaled by their spring constants
+        t_off = t_ang - t_s
+        n_off = n_len - n_s
+        c_off = m.atan2(d_y, d_x) + m.pi - t_ang - c_s
+        g_off = g_len - g_s
+        t_f = t_k * t_off
+        n_f = n_k * n_off
+        c_f = c_k * c_off
+        g_f = g_k * g_off
+        energy = 0.5 * (t_f * t_off + n_f * n_off + c_f * c_off + 
+                        g_f * g_off)
+        # First derivatives of each segment value; the C angle's is that of 
+        # the head about the converter (a) less that of the T angle
+        dt_x = -y / n_sq
+        dt_y = x / n_sq
+        dn_x = x / n_len
+        dn_y = y / n_len
+        da_x = d_y / g_sq
+        da_y = -d_x / g_sq
+        dc_x = da_x - dt_x
+        dc_y = da_y - dt_y
+        dg_x = -d_x / g_len
+        dg_y = -d_y / g_len
+        g_x = t_f * dt_x + n_f * dn_x + c_f * dc_x + g_f * dg_x
+        g_y = t_f * dt_y + n_f * dn_y + c_f * dc_y + g_f * dg_y
+        # Second derivatives, the T and head angles' having yy = -xx
+        t_2 = (t_f - c_f) / (n_sq * n_sq)
+        a_2 = c_f / (g_sq * g_sq)
+        n_3 = n_f / (n_sq * n_len)
+        g_3 = g_f / (g_sq * g_len)
+        angles_xx = 2 * (t_2 * x * y + a_2 * d_x * d_y)
+        h_xx = (t_k * dt_x * dt_x + n_k * dn_x * dn_x + c_k * dc_x * dc_x + 
+                g_k * dg_x * dg_x + angles_xx + n_3 * y * y + g_3 * d_y * d_y)
+        h_xy = (t_k * dt_x * dt_y + n_k * dn_x * dn_y + c_k * dc_x * dc_y + 
+                g_k * dg_x * dg_y + t_2 * (y * y - x * x) + 
+                a_2 * (d_y * d_y - d_x * d_x) - n_3 * x * y - 
+                g_3 * d_x * d_y)
+        h_yy = (t_k * dt_y * dt_y + n_k * dn_y * dn_y + c_k * dc_y * dc_y + 
+                g_k * dg_y * dg_y - angles_xx + n_3 * x * x + g_3 * d_x * d_x)
+        return (energy, g_x, g_y, h_xx, h_xy, h_yy)
+    
+    def minimize_energy_batch(self, h_locs, state, guess=None, gtol=1e-6, 
+                              max_iter=50, full_output=False):
+        """The cross-bridge's minimum energies for many head locations
+        
+        All the locations are solved at once with damped Newton steps on the 
+        converter location, using the analytic gradient and Hessian from 
+        energy_derivs_batch. Each point starts at the rest converter location
+        (like minimize_energy), or at its guess, and drops out of the batch 
+        once the largest component of its gradient falls below gtol. Warm
+        started points that fail to converge or end up more than warm_jump 
+        from their guess have likely slid into another basin, and are solved
+        again from the rest location. Over the CreateData grid the minima 
+        agree with the per-point BFGS solution of minimize_energy to within 
+        1e-8 RT in energy and 1e-4 nm in converter location; far outside it
+        (heads level with or below the converter) the two methods may settle
+        into different local minima.
+        Takes:
+            h_locs: (N, 2) array of [x,y] locations of the cross-bridge tip
+            state: state of the cross-bridge, 1, 2, or 3
+            guess: (N, 2) array of converter locations to start from, such 
+                as the solutions at neighboring head locations
+            gtol: gradient magnitude below which a point has converged
+            max_iter: maximum number of Newton iterations
+            full_output: if True, also return a dictionary of solver info
+        Returns:
+            energies: (N,) array of the cross-bridge's minimum energies
+            min_convs: (N, 2) array of converter locations at those minima
+            info: (if full_output) a dictionary holding 
+                converged: (N,) boolean mask, True where the point converged
+                iterations: (N,) array of Newton iterations taken per point
+                fevals: (N,) array of energy evaluations per point
+                gevals: (N,) array of gradient/Hessian evaluations per point
+                restarted: (N,) boolean mask, True where a warm start was 
+                    abandoned for a cold one
+        """
+        h_locs = _as_locs(h_locs)
+        rest_conv_loc = self.springs.rest_convs[state]
+        if guess is None:
+            start_convs = np.tile(rest_conv_loc, (len(h_locs), 1))
+        else:
+            start_convs = _as_locs(guess).copy()
+        (energies, min_convs, info) = self._newton_batch(
+            h_locs, state, start_convs, gtol, max_iter)
+        info['restarted'] = np.zeros(len(h_locs), dtype=bool)
+        if guess is not None:
+            jumps = np.hypot(*(min_convs - start_convs).T)
+            restart = np.flatnonzero((jumps > self.warm_jump) | 
+                                     ~info['converged'])
+            if len(restart) > 0:
+                (energies[restart], min_convs[restart], cold_info) = \
+                    self._newton_batch(h_locs[restart], state, 
+                                       np.tile(rest_conv_loc, 
+                                               (len(restart), 1)), 
+                                       gtol, max_iter)
+                info['converged'][restart] = cold_info['converged']
+                for key in ('iterations', 'fevals', 'gevals'):
+                    info[key][restart] += cold_info[key]
+                info['restarted'][restart] = True
+        if full_output:
+            return (energies, min_convs, info)
+        return (energies, min_convs)
+    
+    def _newton_batch(self, h_locs, state, min_convs, gtol, max_iter):
+        """Run the damped Newton iterations of minimize_energy_batch from 
+        the starting converter locations in min_convs, updating them in place
+        """
+        energies, grads, hessians = self.energy_derivs_batch(min_convs, 
+                                                             h_locs, state)
+        iterations = np.zeros(len(h_locs), dtype=int)
+        fevals = np.ones(len(h_locs), dtype=int)
+        gevals = np.ones(len(h_locs), dtype=int)
+        active = np.abs(grads).max(axis=1) > gtol
+        for i in range(max_iter):
+            if not active.any():
+                break
+            act = np.flatnonzero(active)
+            steps = _newton_steps(grads[act], hessians[act])
+            # Backtrack each point's step until it gives sufficient decrease
+            slope = np.sum(grads[act] * steps, axis=1)
+            alpha = np.ones(len(act))
+            trial_convs = min_convs[act] + steps
+            trial_energies = self.energy_batch(trial_convs, h_locs[act], state)
+            fevals[act] += 1
+            for j in range(30):
+                bad = (trial_energies > energies[act] + 1e-4 * alpha * slope)
+                if not bad.any():
+                    break
+                alpha[bad] *= 0.5
+                trial_convs[bad] = (min_convs[act[bad]] + 
+                                    alpha[bad, None] * steps[bad])
+                trial_energies[bad] = self.energy_batch(
+                    trial_convs[bad], h_locs[act[bad]], state)
+                fevals[act[bad]] += 1
+            min_convs[act] = trial_convs
+            energies[act], grads[act], hessians[act] = \
+                self.energy_derivs_batch(trial_convs, h_locs[act], state)
+            iterations[act] += 1
+            fevals[act] += 1
+            gevals[act] += 1
+            # Points whose steps no longer move them are as good as it gets
+            stalled = np.abs(alpha[:, None] * steps).max(axis=1) < 1e-12
+            active[act] = (np.abs(grads[act]).max(axis=1) > gtol) & ~stalled
+        converged = np.abs(grads).max(axis=1) <= gtol
+        return (energies, min_convs, 
+                {'converged': converged, 'iterations': iterations, 
+                 'fevals': fevals, 'gevals': gevals})
     
     def energy(self, conv_loc, h_loc, state):
         """Return the energy in the xb with the given parameters"""
         (t_ang, n_len, c_ang, g_len) = self.seg_values(conv_loc, h_loc)
-        return float(
-            self.t.energy(t_ang, state) + 
-            self.n.energy(n_len, state) + 
-            self.c.energy(c_ang, state) + 
-            self.g.energy(g_len, state) 
-        )
-    
-    def free_energy(self, h_loc, state):
-        """Return the free energy in the xb with the given parameters"""
+        (t_k, n_k, c_k, g_k) = self.springs.k
+        (t_s, n_s, c_s, g_s) = self.springs.rests[state]
+        return float(0.5 * t_k * (t_ang - t_s)**2 + 
+                     0.5 * n_k * (n_len - n_s)**2 + 
+                     0.5 * c_k * (c_ang - c_s)**2 + 
+                     0.5 * g_k * (g_len - g_s)**2)
+    
+    def energy_grad(self, conv_loc, h_loc, state):
+        """Return the gradient of energy w.r.t. the converter location, see 
+        energy_derivs_batch for the derivatives of each segment value"""
+        (t_ang, n_len, c_ang, g_len) = self.seg_values(conv_loc, h_loc)
+        (x, y) = (conv_loc[0], conv_loc[1])
+        (d_x, d_y) = (h_loc[0] - x, h_loc[1] - y)
+        (t_k, n_k, c_k, g_k) = self.springs.k
+        (t_s, n_s, c_s, g_s) = self.springs.rests[state]
+        t_f = t_k * (t_ang - t_s) / n_len**2
+        n_f = n_k * (n_len - n_s) / n_len
+        c_f = c_k * (c_ang - c_s)
+        g_f = g_k * (g_len - g_s) / g_len
+        return np.array([
+            -t_f * y + n_f * x + c_f * (d_y / g_len**2 + y / n_len**2) - 
+            g_f * d_x,
+            t_f * x + n_f * y - c_f * (d_x / g_len**2 + x / n_len**2) - 
+            g_f * d_y])
+    
+    def energy_batch(self, conv_locs, h_locs, state):
+        """Return the energies in the xb for arrays of conv and head locs"""
+        (t_ang, n_len, c_ang, g_len) = self.seg_values_batch(conv_locs, h_locs)
+        (t_k, n_k, c_k, g_k) = self.springs.k
+        (t_s, n_s, c_s, g_s) = self.springs.rests[state]
+        return (0.5 * t_k * (t_ang - t_s)**2 + 
+                0.5 * n_k * (n_len - n_s)**2 + 
+                0.5 * c_k * (c_ang - c_s)**2 + 
+                0.5 * g_k * (g_len - g_s)**2)
+    
+    def energy_derivs_batch(self, conv_locs, h_locs, state):
+        """Return the energies in the xb and their first and second 
+        derivatives with respect to the converter location
+        
+        Takes:
+            conv_locs: (N, 2) array of [x,y] converter locations
+            h_locs: (N, 2) array of [x,y] head locations
+            state: state of the cross-bridge, 1, 2, or 3
+        Returns:
+            energies: (N,) array of energies
+            grads: (N, 2) array of dE/d(conv_x, conv_y)
+            hessians: (N, 2, 2) array of second derivatives
+        """
+        conv_locs = _as_locs(conv_locs)
+        h_locs = _as_locs(h_locs)
+        (t_ang, n_len, c_ang, g_len) = self.seg_values_batch(conv_locs, h_locs)
+        (x, y) = (conv_locs[:, 0], conv_locs[:, 1])
+        (d_x, d_y) = (h_locs[:, 0] - x, h_locs[:, 1] - y)
+        n_sq, g_sq = n_len**2, g_len**2
+        # Gradients and Hessians of each segment value w.r.t. the converter
+        d_t = np.column_stack((-y, x)) / n_sq[:, None]
+        dd_t = np.array([[2*x*y, y**2 - x**2], 
+                         [y**2 - x**2, -2*x*y]]) / n_sq**2
+        d_n = np.column_stack((x, y)) / n_len[:, None]
+        dd_n = np.array([[y**2, -x*y], [-x*y, x**2]]) / n_len**3
+        d_c = np.column_stack((d_y, -d_x)) / g_sq[:, None] - d_t
+        dd_c = np.array([[2*d_x*d_y, d_y**2 - d_x**2], 
+                         [d_y**2 - d_x**2, -2*d_x*d_y]]) / g_sq**2 - dd_t
+        d_g = -np.column_stack((d_x, d_y)) / g_len[:, None]
+        dd_g = np.array([[d_y**2, -d_x*d_y], [-d_x*d_y, d_x**2]]) / g_len**3
+        # Sum the springs: E = sum(.5 k (s-s0)^2) 
+        energies = np.zeros(len(conv_locs))
+        grads = np.zeros((len(conv_locs), 2))
+        hessians = np.zeros((len(conv_locs), 2, 2))
+        for k, rest, val, d_val, dd_val in zip(
+                self.springs.k, self.springs.rests[state], 
+                (t_ang, n_len, c_ang, g_len), (d_t, d_n, d_c, d_g), 
+                (dd_t, dd_n, dd_c, dd_g)):
+            strain = val - rest
+            energies += 0.5 * k * strain**2
+            grads += k * strain[:, None] * d_val
+            hessians += k * (d_val[:, :, None] * d_val[:, None, :] + 
+                             strain[:, None, None] * 
+                             dd_val.transpose(2, 0, 1))
+        return (energies, grads, hessians)
+    
+    def free_energy_offset(self, state):
+        """Return the free energy liberated by ATP hydrolysis by a state"""
         g_0 = 13 #in RT 
         atp_conc = 0.005 # or 5 mM
         adp_conc = 0.00003 # or 30 uM
@@ -217,27 +825,77 @@ class Crossbridge(object):
         g_lib = - g_0 - log(atp_conc / (adp_conc * phos_conc))
         alph = 0.28 #G_lib freed in 0->1 trans, from Bert/Tom/Pate/Cooke
         eta = 0.68 #ditto, for 1->2 trans
+        if state == 2:
+            return float(alph * g_lib)
+        elif state == 3:
+            return float(eta * g_lib)
+        return float(0)
+    
+    def free_energy(self, h_loc, state, guess=None):
+        """Return the free energy in the xb with the given parameters"""
         if state is 1:
             return float(0)
-        elif state is 2:
-            return float(alph * g_lib + self.minimize_energy(h_loc, state)[0])
-        elif state is 3:
-            return float(eta * g_lib + self.minimize_energy(h_loc, state)[0])
-        
-    def force(self, h_loc, state):
+        elif state is 2 or state is 3:
+            return float(self.free_energy_offset(state) + 
+                         self._minimum(h_loc, state, guess)[0])
+    
+    def free_energy_batch(self, h_locs, state, guess=None):
+        """Return the free energies in the xb for an (N, 2) array of h_locs"""
+        h_locs = _as_locs(h_locs)
+        if state == 1:
+            return np.zeros(len(h_locs))
+        return (self.free_energy_offset(state) + 
+                self.minimize_energy_batch(h_locs, state, guess)[0])
+    
+    def force(self, h_loc, state, guess=None):
         """From the head loc, the force vector being exerted by the XB"""
-        (energy, conv_loc) = self.minimize_energy(h_loc, state)
-        (t_ang, n_len, c_ang, g_len) = self.seg_values(conv_loc, h_loc)
-        del(energy, t_ang, n_len) # Not needed
-        c_k = self.c.k
-        g_k = self.g.k
-        c_s = self.c.rest(state)
-        g_s = self.g.rest(state)
-        f_x = (-g_k * (g_len - g_s) * m.cos(c_ang) + 
-                1/g_len * c_k * (c_ang - c_s) * m.sin(c_ang))
-        f_y = (-g_k * (g_len - g_s) * m.sin(c_ang) + 
-                1/g_len * c_k * (c_ang - c_s) * m.cos(c_ang))
-        return [float(f_x), float(f_y)]
+        conv_loc = self._minimum(h_loc, state, guess)[1]
+        return self._force_scalar(conv_loc, h_loc, state)
+    
+    def force_batch(self, h_locs, state, guess=None):
+        """From an (N, 2) array of head locs, the (N, 2) force vectors"""
+        h_locs = _as_locs(h_locs)
+        conv_locs = self.minimize_energy_batch(h_locs, state, guess)[1]
+        return self._force_at(conv_locs, h_locs, state)
+    
+    def _force_at(self, conv_locs, h_locs, state):
+        """The (N, 2) force vectors with the converters at conv_locs
+        
+        At the converter location minimizing the energy, the energy's
+        gradient in the converter is zero, so the gradient of the minimized
+        energy in the head location is just the partial gradient of the
+        springs the head moves, C and G, with the converter held still.
+        That is worked out here from the one minimization already made,
+        without a second search or a finite difference, as +dE/dh, the sign
+        the forces have always been stored with.
+        """
+        conv_locs = np.asarray(conv_locs, dtype=float)
+        d_x = h_locs[:, 0] - conv_locs[:, 0]
+        d_y = h_locs[:, 1] - conv_locs[:, 1]
+        g_sq = d_x**2 + d_y**2
+        g_len = np.sqrt(g_sq)
+        c_ang = (np.arctan2(d_y, d_x) + np.pi -
+                 np.arctan2(conv_locs[:, 1], conv_locs[:, 0]))
+        (c_k, g_k) = self.springs.k[2:]
+        (c_s, g_s) = self.springs.rests[state][2:]
+        # dE/dg along the G segment, and dE/dc over the lever arm g
+        g_f = g_k * (g_len - g_s) / g_len
+        c_f = c_k * (c_ang - c_s) / g_sq
+        return np.column_stack((g_f * d_x - c_f * d_y, g_f * d_y + c_f * d_x))
+    
+    def _force_scalar(self, conv_loc, h_loc, state):
+        """The [x,y] force vector with the converter at conv_loc, as
+        _force_at but in plain floats for a single head"""
+        (x, y) = (float(conv_loc[0]), float(conv_loc[1]))
+        (d_x, d_y) = (h_loc[0] - x, h_loc[1] - y)
+        g_sq = d_x**2 + d_y**2
+        g_len = m.sqrt(g_sq)
+        c_ang = m.atan2(d_y, d_x) + m.pi - m.atan2(y, x)
+        (c_k, g_k) = self.springs.k[2:]
+        (c_s, g_s) = self.springs.rests[state][2:]
+        g_f = g_k * (g_len - g_s) / g_len
+        c_f = c_k * (c_ang - c_s) / g_sq
+        return [float(g_f * d_x - c_f * d_y), float(g_f * d_y + c_f * d_x)]
     
     def seg_values(self, conv_loc, h_loc):
         """Calculate the values of the segments of the XB"""
@@ -248,53 +906,193 @@ class Crossbridge(object):
         g_len = m.hypot(diff[0], diff[1])
         return (t_ang, n_len, c_ang, g_len)
     
+    def seg_values_batch(self, conv_locs, h_locs):
+        """Calculate the segment values of the XB for arrays of locations"""
+        conv_locs = _as_locs(conv_locs)
+        h_locs = _as_locs(h_locs)
+        diff = h_locs - conv_locs
+        t_ang = np.arctan2(conv_locs[:, 1], conv_locs[:, 0])
+        n_len = np.hypot(conv_locs[:, 0], conv_locs[:, 1])
+        c_ang = np.arctan2(diff[:, 1], diff[:, 0]) + pi - t_ang
+        g_len = np.hypot(diff[:, 0], diff[:, 1])
+        return (t_ang, n_len, c_ang, g_len)
+    
+    def head_loc(self, t_ang, n_len, c_ang, g_len):
+        """Translate spring values to the (x,y) postition of the head"""
+        conv_loc = (n_len * np.cos(t_ang),
+                    n_len * np.sin(t_ang))
+        return (conv_loc[0] + g_len * np.cos(c_ang + t_ang - pi), 
+                conv_loc[1] + g_len * np.sin(c_ang + t_ang - pi))
+    
+    def bop_heads(self, size=None):
+        """Bop the springs to new values and return the resulting head 
+        location as (x, y), each of the given size if one is passed
+        """
+        return self.head_loc(self.t.bop(size), self.n.bop(size), 
+                             self.c.bop(size), self.g.bop(size))
+    
+    def head_density(self, x_locs, y_locs, order=20):
+        """The probability of a bopped head landing in each cell of an evenly 
+        spaced grid, as a (y_locs.size, x_locs.size) array.
+        
+        Given the converter location, the bopped G length and C angle place 
+        the head with a density known in closed form in polar coordinates 
+        about the converter (see conv_head_density). That is averaged over 
+        the bopped T angle and N length by Gauss-Hermite quadrature of the 
+        given order; the default is good to about 1e-4 of the peak density.
+        """
+        ((t_ang, n_len), weights) = _bop_nodes([self.t, self.n], order)
+        x_grid, y_grid = np.meshgrid(x_locs, y_locs)
+        density = np.zeros(x_grid.shape)
+        for t_node, n_node, weight in zip(t_ang, n_len, weights):
+            density += weight * self.conv_head_density(x_grid, y_grid, 
+                                                       t_node, n_node)
+        return density * _cell_area(x_locs, y_locs)
+    
+    def conv_head_density(self, h_x, h_y, t_ang, n_len):
+        """The density of bopped heads at (h_x, h_y) with the converter held 
+        at the location given by t_ang and n_len. The normal G length and 
+        C angle are the polar coordinates of the head about the converter, 
+        so the density is their joint density over the Jacobian, g_len.
+        """
+        d_x = h_x - n_len * m.cos(t_ang)
+        d_y = h_y - n_len * m.sin(t_ang)
+        g_len = np.hypot(d_x, d_y)
+        # The C angle, less its rest value, wrapped to [-pi, pi)
+        c_off = np.arctan2(d_y, d_x) - (self.c.weak + t_ang - pi)
+        c_off = (c_off + pi) % (2*pi) - pi
+        return (np.exp(-0.5 * ((g_len - self.g.weak) / self.g.stand_dev)**2 - 
+                       0.5 * (c_off / self.c.stand_dev)**2) / 
+                (2*pi * self.g.stand_dev * self.c.stand_dev * 
+                 np.maximum(g_len, 1e-12)))
+    
+    def bind_prob(self, d_x, d_y):
+        """The binding probability of a head offset (d_x, d_y) from a site, 
+        values over one always bind"""
+        ## The binding prob is dept on the exp of a dist
+        return 12*np.exp(-(d_x**2 + d_y**2))
+    
     def bind_or_not(self, b_site):
         """Given an (x,y) location of an open binding site, bind or not after
         bopping the cross-bridge head to a new location. Return a boolean,
         True for a binding event and False for no binding event.
         """
-        ## Bop the springs to get new values
-        t_ang = self.t.bop()
-        n_len = self.n.bop()
-        c_ang = self.c.bop()
-        g_len = self.g.bop()
-        ## Translate those values to (x,y) postitions
-        conv_loc = (n_len * m.cos(t_ang),
-                    n_len * m.sin(t_ang))
-        h_loc = (conv_loc[0] + g_len * m.cos(c_ang + t_ang - m.pi), 
-                 conv_loc[1] + g_len * m.sin(c_ang + t_ang - m.pi))
-        ## Find the distance to the binding site
-        distance = m.hypot(b_site[0]-h_loc[0], b_site[1]-h_loc[1])
-        ## The binding prob is dept on the exp of a dist
-        b_prob = 12*m.exp(-distance**2)
+        (h_x, h_y) = self.bop_heads()
+        b_prob = self.bind_prob(b_site[0] - h_x, b_site[1] - h_y)
         ## Throw a random number to check binding
-        return (b_prob > random.rand())
+        return bool(b_prob > random.rand())
+    
+    def bind_or_not_batch(self, b_sites, trials):
+        """Given an (N, 2) array of open binding sites, bop the head trials 
+        times for each and return an (N, trials) boolean array of binding 
+        events, all drawn at once.
+        """
+        b_sites = _as_locs(b_sites)
+        (h_x, h_y) = self.bop_heads((len(b_sites), trials))
+        b_prob = self.bind_prob(b_sites[:, 0, None] - h_x, 
+                                b_sites[:, 1, None] - h_y)
+        return (b_prob > random.rand(len(b_sites), trials))
     
     def r12(self, b_site, trials):
         """Give the prob of binding, given a b_site and number of trials """
-        # Binds gives us the number of times binding occurs out of all trials
-        binds = sum(self.bind_or_not(b_site) for t in range(trials))
-        return (float(binds)/float(trials))
+        return float(self.r12_batch([b_site], trials)[0])
+    
+    def r12_batch(self, b_sites, trials, max_draws=2**20):
+        """Give the prob of binding at each of an (N, 2) array of b_sites, 
+        drawing at most max_draws trials at once to bound memory use"""
+        b_sites = _as_locs(b_sites)
+        rows = max(1, max_draws // trials)
+        binds = np.zeros(len(b_sites))
+        for i in range(0, len(b_sites), rows):
+            # Binds gives us the number of times binding occurs 
+            binds[i:i+rows] = self.bind_or_not_batch(b_sites[i:i+rows], 
+                                                     trials).sum(axis=1)
+        return binds / float(trials)
+    
+    def r12_exact_grid(self, x_locs, y_locs):
+        """Give the prob of binding at every site of an evenly spaced grid, 
+        as a (y_locs.size, x_locs.size) array, without Monte Carlo noise.
+        
+        The chance a head bopped to h binds to a site b is bind_prob(b - h), 
+        clipped to at most one, so r12 is that kernel convolved with the 
+        head_density. The density is built once on the binding site grid, 
+        padded by bind_reach on all sides, and convolved with the kernel in 
+        one FFT. Any floor the kernel has far from the head is added back 
+        afterwards, as every head is that likely to bind. 
+        """
+        x_locs = np.asarray(x_locs, dtype=float)
+        y_locs = np.asarray(y_locs, dtype=float)
+        (d_x, d_y) = _grid_steps(x_locs, y_locs)
+        pad_x = int(np.ceil(self.bind_reach / d_x))
+        pad_y = int(np.ceil(self.bind_reach / d_y))
+        density = self.head_density(
+            x_locs[0] + d_x * np.arange(-pad_x, x_locs.size + pad_x), 
+            y_locs[0] + d_y * np.arange(-pad_y, y_locs.size + pad_y))
+        floor = float(np.minimum(self.bind_prob(np.inf, np.inf), 1))
+        k_x, k_y = np.meshgrid(d_x * np.arange(-pad_x, pad_x + 1), 
+                               d_y * np.arange(-pad_y, pad_y + 1))
+        kernel = np.minimum(self.bind_prob(k_x, k_y), 1) - floor
+        rates = fftconvolve(density, kernel, mode='valid') + floor
+        return np.clip(rates, 0, 1)
     
     def r23(self, b_site):
         """Given a binding site, b_site, to which a myosin head is loosely
         bound, return a probability of transition to a tightly bound state
         """
-        state2_energy = self.minimize_energy(b_site, 2)[0]
-        state3_energy = self.minimize_energy(b_site, 3)[0]
+        state2_energy = self._minimum(b_site, 2)[0]
+        state3_energy = self._minimum(b_site, 3)[0]
         rate = .1 * (1 + m.tanh(.4 * (state2_energy - state3_energy)+4))+.001
         # Note that the .001 is just to keep rates above 0.0000 at all times
         return float(rate)
     
+    def r23_batch(self, b_sites):
+        """Return the r23 rates for an (N, 2) array of binding sites"""
+        state2_energy = self.minimize_energy_batch(b_sites, 2)[0]
+        state3_energy = self.minimize_energy_batch(b_sites, 3)[0]
+        return _r23_rate(state2_energy, state3_energy)
+    
     def r31(self, b_site):
         """Given a binding site, b_site, to which a myosin head is tightly
         bound, return a probability of transition to an unbound state
         """
-        state3_energy = self.minimize_energy(b_site, 3)[0]
+        state3_energy = self._minimum(b_site, 3)[0]
         #rate = m.exp(-1 / (state3_energy + 1e-9)) #1e-9 avoids 1/0 at rest loc
         rate =  m.sqrt(.01 * state3_energy) + 0.02
         return float(rate)
     
+    def r31_batch(self, b_sites):
+        """Return the r31 rates for an (N, 2) array of binding sites"""
+        state3_energy = self.minimize_energy_batch(b_sites, 3)[0]
+        return _r31_rate(state3_energy)
+    
+    def deterministic_grid(self, x_locs, y_locs):
+        """Return a dict of every property that needs no Monte Carlo, over 
+        the whole grid of head locations at once: energy, free_energy, 
+        post_energy, min_conv2, min_conv3, force1, force2, force3, r23 and
+        r31, each a (y_locs.size, x_locs.size) array, or (..., 2) for the
+        vectors. Each state is minimized once and its energies and converter
+        locations shared between the properties that need them; where
+        closed_form is set that minimization is a handful of array
+        expressions."""
+        x_grid, y_grid = np.meshgrid(x_locs, y_locs)
+        h_locs = np.column_stack((x_grid.ravel(), y_grid.ravel()))
+        (props, energies) = ({}, {})
+        for state in (1, 2, 3):
+            (energies[state], conv_locs) = \
+                    self.minimize_energy_batch(h_locs, state)
+            props['force' + str(state)] = self._force_at(conv_locs, h_locs, 
+                                                         state)
+            if state > 1:
+                props['min_conv' + str(state)] = conv_locs
+        props['energy'] = energies[1]
+        props['free_energy'] = energies[2] + self.free_energy_offset(2)
+        props['post_energy'] = energies[3] + self.free_energy_offset(3)
+        props['r23'] = _r23_rate(energies[2], energies[3])
+        props['r31'] = _r31_rate(energies[3])
+        for prop, vals in props.items():
+            props[prop] = np.reshape(vals, x_grid.shape + np.shape(vals)[1:])
+        return props
+    
 
 class FourSpring(Crossbridge):
     """An instance of the four-spring crossbridge.
@@ -309,9 +1107,9 @@ class FourSpring(Crossbridge):
         /     
     ===T====== - Thick filament,    torsional spring
     """
-    def __init__(self, config = None):
+    def __init__(self, config = None, minimizer = 'bfgs', cache_size = 4096):
         """No modification of values needed, just trigger the att calc"""
-        Crossbridge.__init__(self, config)
+        Crossbridge.__init__(self, config, minimizer, cache_size)
     
 
 class TwoSpring(Crossbridge):
@@ -327,61 +1125,103 @@ class TwoSpring(Crossbridge):
         /     
     ===T====== - Thick filament,    fixed angle
     """
-    def __init__(self, config = None):
+    closed_form = True
+    
+    def __init__(self, config = None, minimizer = 'bfgs', cache_size = 4096):
         """Modify values for this spring system, trigger the attribute calc"""
-        Crossbridge.__init__(self, config)
+        Crossbridge.__init__(self, config, minimizer, cache_size)
     
-    def minimize_energy(self, h_loc, state):
+    def _minimum(self, h_loc, state, guess=None, full_output=False):
         """Return the min energy in the XB with the head at the given loc"""
-        rest_conv_loc = (self.n.rest(state) * m.cos(self.t.rest(state)),
-                         self.n.rest(state) * m.sin(self.t.rest(state)))
-        return (self.energy(rest_conv_loc, h_loc, state), rest_conv_loc)
+        rest_conv_loc = self.springs.rest_convs[state]
+        energy = self.energy(rest_conv_loc, h_loc, state)
+        return (energy, rest_conv_loc, _NO_SEARCH_INFO)
     
-    def bind_or_not(self, b_site):
-        """Given an (x,y) location of an open binding site, bind or not after
-        bopping the cross-bridge head to a new location. Return a boolean,
-        True for a binding event and False for no binding event.
+    def minimize_energy_batch(self, h_locs, state, guess=None):
+        """Return the min energies in the XB with the heads at the given locs"""
+        h_locs = _as_locs(h_locs)
+        rest_conv_loc = self.springs.rest_convs[state]
+        conv_locs = np.tile(rest_conv_loc, (len(h_locs), 1))
+        return (self.energy_batch(conv_locs, h_locs, state), conv_locs)
+    
+    def bop_heads(self, size=None):
+        """Bop the springs to new values and return the resulting head 
+        location as (x, y), each of the given size if one is passed
         """
-        ## Bop the springs to get new values
-        t_ang = self.t.rest(1)
-        n_len = self.n.rest(1)
-        c_ang = self.c.bop()
-        g_len = self.g.bop()
-        ## Translate those values to (x,y) postitions
-        conv_loc = (n_len * m.cos(t_ang),
-                    n_len * m.sin(t_ang))
-        h_loc = (conv_loc[0] + g_len * m.cos(c_ang + t_ang - m.pi), 
-                 conv_loc[1] + g_len * m.sin(c_ang + t_ang - m.pi))
-        ## Find the distance to the binding site
-        distance = m.hypot(b_site[0]-h_loc[0], b_site[1]-h_loc[1])
+        return self.head_loc(self.t.rest(1), self.n.rest(1), 
+                             self.c.bop(size), self.g.bop(size))
+    
+    def head_density(self, x_locs, y_locs):
+        """The probability of a bopped head landing in each cell of an evenly 
+        spaced grid, with the converter fixed at its rest location"""
+        x_grid, y_grid = np.meshgrid(x_locs, y_locs)
+        return (self.conv_head_density(x_grid, y_grid, 
+                                       self.t.rest(1), self.n.rest(1)) * 
+                _cell_area(x_locs, y_locs))
+    
+    def bind_prob(self, d_x, d_y):
+        """The binding probability of a head offset (d_x, d_y) from a site, 
+        values over one always bind"""
         ## The binding prob is dept on the exp of a dist
-        b_prob = 72*m.exp(-distance**2) +.00001
-        ## Throw a random number to check binding
-        return (b_prob > random.rand())
+        return 72*np.exp(-(d_x**2 + d_y**2)) +.00001
     
 
 class OneSpring(Crossbridge):
     """An instance of the one-spring crossbridge"""
-    def __init__(self, config = None):
-        Crossbridge.__init__(self, config)
+    closed_form = True
+    
+    def __init__(self, config = None, minimizer = 'bfgs', cache_size = 4096):
+        Crossbridge.__init__(self, config, minimizer, cache_size)
     
-    def minimize_energy(self, h_loc, state):
+    def _minimum(self, h_loc, state, guess=None, full_output=False):
         """Return the min energy of the XB at h_loc, ignore y dimension"""
         # Ignore y dim and only use energy in neck
-        return (self.n.energy(h_loc[0], state), (h_loc[0], 0))
+        energy = 0.5 * self.springs.k[1] * (h_loc[0] -
+                                            self.springs.rests[state][1])**2
+        return (energy, (h_loc[0], 0), _NO_SEARCH_INFO)
     
-    def bind_or_not(self, b_site):
-        """Given an (x,y) location of an open binding site, bind or not after
-        bopping the cross-bridge head to a new location. Return a boolean,
-        True for a binding event and False for no binding event.
+    def minimize_energy_batch(self, h_locs, state, guess=None):
+        """Return the min energies of the XB at h_locs, ignore y dimension"""
+        h_locs = _as_locs(h_locs)
+        energies = 0.5 * self.springs.k[1] * (h_locs[:, 0] -
+                                              self.springs.rests[state][1])**2
+        conv_locs = np.column_stack((h_locs[:, 0], np.zeros(len(h_locs))))
+        return (energies, conv_locs)
+    
+    def _force_at(self, conv_locs, h_locs, state):
+        """The (N, 2) gradients of the neck energy, all along x"""
+        h_locs = np.asarray(h_locs, dtype=float)
+        f_x = self.springs.k[1] * (h_locs[:, 0] -
+                                   self.springs.rests[state][1])
+        return np.column_stack((f_x, np.zeros(len(h_locs))))
+    
+    def _force_scalar(self, conv_loc, h_loc, state):
+        """The gradient of the neck energy, all along x"""
+        return [float(self.springs.k[1] * (h_loc[0] -
+                                           self.springs.rests[state][1])),
+                0.0]
+    
+    def bop_heads(self, size=None):
+        """Bop the spring to a new value and return the resulting head 
+        location as (x, y), each of the given size if one is passed
         """
         ## Bop the spring to get a new value
-        n_len = self.n.bop()
-        ## Find the distance to the binding site
-        distance = abs(b_site[0]-n_len) #Ignore y dim
-        ## The binding prob is dept on the exp of a dist
-        b_prob = m.exp(-distance)
-        ## Throw a random number to check binding
-        return (b_prob > random.rand())
+        n_len = self.n.bop(size)
+        return (n_len, 0 * n_len)
     
-
+    def bind_prob(self, d_x, d_y):
+        """The binding probability of a head offset (d_x, d_y) from a site"""
+        ## The binding prob is dept on the exp of a dist, ignore y dim
+        return np.exp(-abs(d_x))
+    
+    def r12_exact_grid(self, x_locs, y_locs):
+        """Give the prob of binding at every site of a grid without Monte 
+        Carlo noise. The binding kernel ignores the y dim and the bopped 
+        neck length is normal, so the mean of exp(-|d|) over the offset 
+        d ~ N(x - rest, sd^2) is found in closed form for each x; every 
+        row is the same."""
+        offset = np.asarray(x_locs, dtype=float) - self.n.weak
+        sd = self.n.stand_dev
+        row = (np.exp(-offset + 0.5*sd**2 + log_ndtr((offset - sd**2)/sd)) + 
+               np.exp(offset + 0.5*sd**2 + log_ndtr((-offset - sd**2)/sd)))
+        return np.tile(row, (np.size(y_locs), 1))
@@ -0,0 +1,182 @@
+"""
+Huxley.py
+
+Evolves the distribution of crossbridge states over binding site offset
+through time, after the fashion of Huxley (1957), for the force transients
+that follow length steps and ramps.
+"""
+
+import numpy as np
+from scipy.linalg import expm
+import LookupCrossbridge
+import Kinetics
+from CreateData import d10_to_fil_sep
+
+
+__max_rate__ = 1e6 # Reverse rates are capped here, far past any 1 / dt used,
+                   # so the propagators' scaling and squaring doesn't overflow
+
+
+class Huxley():
+    """The share of crossbridges in each state at each binding site offset.
+
+    Binding sites are taken as spread evenly over the stored x range, at the
+    filament separation of a chosen d10, so that the state of the whole
+    population is the (nx, 3) chance of each state at each stored x. The
+    rates and forces along that row are looked up once. Sliding the
+    filaments carries the bound crossbridges along the characteristics
+    x + d_x, exactly when d_x is a whole number of grid spacings and by
+    first order upwind interpolation for what remains; sites coming in from
+    off the grid come in unbound. Between slides the states change by the
+    exact solution of the kinetics at each offset, with the reverse rates
+    set by detailed balance as in Kinetics.steady_state but no faster than
+    __max_rate__, through a 3x3 propagator per offset worked out once for
+    each time step used.
+    Positive d_x lengthens the half-sarcomere, as moving the Z-line does in
+    Lattice.HalfSarcomere, and time is in the units of the stored rates.
+    Use steady_state() to start from isometric steady state
+        shift(d_x) and advance(dt) to move the filaments and kinetics
+        force() for the mean force per crossbridge
+        length_step(step, t_end, dt, t2_delay) and ramp(velocity, duration,
+        t_after) to run a whole protocol"""
+
+    def __init__(self, xbtype=4, d10=37.0, lookup=None):
+        """Set up the row of offsets, at steady state
+        Takes:
+            xbtype: number of springs, 1, 2 or 4, of the stored tables to use
+            d10: lattice spacing, nm, choosing the row of the tables used
+            lookup: a LookupCrossbridge to use instead of the stored tables
+        """
+        if lookup is None:
+            lookup = LookupCrossbridge.LookupCrossbridge(xbtype)
+        self.lookup = lookup
+        self.x_locs = lookup.x_locs
+        self.spacing = float(self.x_locs[1] - self.x_locs[0])
+        sites = np.column_stack((self.x_locs, np.repeat(
+            float(d10_to_fil_sep(d10)), len(self.x_locs))))
+        (r12, r23, r31) = (lookup.r12_batch(sites), lookup.r23_batch(sites),
+                           lookup.r31_batch(sites))
+        (g_2, g_3) = (lookup.free_energy_batch(sites, 2),
+                      lookup.free_energy_batch(sites, 3))
+        self._row = (r12, r23, r31, g_2, g_3)
+        # Rate matrices, taking column i to row j at rate q[:, j, i]
+        (r21, r32) = (
+            np.minimum(r12 * np.exp(np.minimum(g_2, 100)), __max_rate__),
+            np.minimum(r23 * np.exp(np.minimum(g_3 - g_2, 100)),
+                       __max_rate__))
+        self.q = np.zeros((len(self.x_locs), 3, 3))
+        self.q[:, 1, 0] = r12
+        self.q[:, 0, 1] = r21
+        self.q[:, 2, 1] = r23
+        self.q[:, 1, 2] = r32
+        self.q[:, 0, 2] = r31
+        self.q[:, [0, 1, 2], [0, 1, 2]] = -self.q.sum(axis=1)
+        self.forces = np.zeros((len(self.x_locs), 3, 2))
+        self.forces[:, 1] = lookup.force_batch(sites, 2)
+        self.forces[:, 2] = lookup.force_batch(sites, 3)
+        self._propagators = {}
+        self.steady_state()
+
+    def steady_state(self):
+        """Put every offset at its steady state occupancy, and the time at 0
+        """
+        self.probs = np.column_stack(Kinetics.steady_state(*self._row))
+        self.time = 0.0
+
+    def shift(self, d_x):
+        """Slide the thin filament d_x past the thick, carrying the bound
+        crossbridges with it"""
+        spacings = d_x / self.spacing
+        whole = int(np.floor(spacings + 1e-9)) # Forgiving rounding error
+        frac = max(spacings - whole, 0.0)
+        bound = self.probs[:, 1:]
+        if whole != 0:
+            moved = np.zeros_like(bound)
+            if 0 < whole < len(bound):
+                moved[whole:] = bound[:-whole]
+            elif -len(bound) < whole < 0:
+                moved[:whole] = bound[-whole:]
+            bound = moved
+        if frac > 0:
+            # Upwind, each offset taking frac of its neighbour below
+            bound = np.concatenate(((1 - frac) * bound[:1],
+                                    (1 - frac) * bound[1:] +
+                                    frac * bound[:-1]))
+        self.probs = np.column_stack((1 - bound.sum(axis=1), bound))
+
+    def _propagator(self, dt):
+        """Return, making them if need be, the (nx, 3, 3) exact propagators
+        of the kinetics at each offset over dt"""
+        if dt not in self._propagators:
+            self._propagators[dt] = np.array([expm(q * dt) for q in self.q])
+        return self._propagators[dt]
+
+    def advance(self, dt):
+        """Run the kinetics at every offset for dt, holding the filaments"""
+        self.probs = np.einsum('nji,ni->nj', self._propagator(dt), self.probs)
+        self.time += dt
+
+    def force(self):
+        """Return the mean [x,y] force per crossbridge"""
+        return (np.einsum('ns,nsk->k', self.probs, self.forces) /
+                len(self.probs))
+
+    def run(self, displacements, dt):
+        """Slide the filaments by each of a series of displacements in turn,
+        advancing dt after each, and return the (T + 1, 2) mean forces at
+        the start and after each step"""
+        forces = [self.force()]
+        for d_x in displacements:
+            if d_x != 0:
+                self.shift(d_x)
+            self.advance(dt)
+            forces.append(self.force())
+        return np.array(forces)
+
+    def length_step(self, step, t_end, dt, t2_delay):
+        """Step the length from isometric steady state and follow the force
+        Takes:
+            step: length change per half-sarcomere, nm, positive stretching
+            t_end: time to follow the force for after the step
+            dt: time step
+            t2_delay: time after the step at which the quick recovery is
+                taken to be over, giving T2
+        Returns:
+            times: (T,) array of times, the step being made at 0
+            forces: (T, 2) array of the mean [x,y] force per crossbridge,
+                the first isometric and the second just after the step
+            t1, t2: axial force just after the step and t2_delay after it,
+                as fractions of the isometric force
+        """
+        self.steady_state()
+        iso = self.force()
+        self.shift(step)
+        n_steps = int(round(t_end / dt))
+        forces = np.vstack((iso, self.run(np.zeros(n_steps), dt)))
+        times = np.concatenate(([0.0], dt * np.arange(n_steps + 1)))
+        t2_force = forces[1 + min(int(round(t2_delay / dt)), n_steps)]
+        return (times, forces, forces[1, 0] / iso[0], t2_force[0] / iso[0])
+
+    def ramp(self, velocity, duration, t_after, dt=None):
+        """Change length at a constant velocity from isometric steady state,
+        then hold it, following the force
+        Takes:
+            velocity: rate of length change per half-sarcomere, positive
+                stretching
+            duration: how long the ramp lasts
+            t_after: how long to hold the length after it
+            dt: time step, by default that moving the filaments exactly one
+                grid spacing per step, so that the sliding is exact
+        Returns:
+            times: (T,) array of times, the ramp starting at 0
+            forces: (T, 2) array of the mean [x,y] force per crossbridge
+        """
+        if dt is None:
+            dt = self.spacing / abs(velocity)
+        self.steady_state()
+        (n_ramp, n_after) = (int(round(duration / dt)),
+                             int(round(t_after / dt)))
+        displacements = np.concatenate((np.repeat(velocity * dt, n_ramp),
+                                        np.zeros(n_after)))
+        forces = self.run(displacements, dt)
+        return (dt * np.arange(len(forces)), forces)
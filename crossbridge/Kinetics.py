@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Kinetics.py
+
+Solves for the steady state occupancy of the three crossbridge states at
+every point of a stored grid, and from it the force, ATP use and duty ratio
+a crossbridge cycling at that binding site would average.
+"""
+
+import sys
+import getopt
+import numpy as np
+import Storage
+
+
+__help_message__ = '''
+Adds steady state kinetic properties to a stored crossbridge:
+Option                Values         Results
+-h, --help                           You see this message
+-x, --crossbridge     1,2,4          Picks the stored crossbridge to solve
+-v, --velocity        Float          Instead writes the force and ATPase at 
+                                       velocities from -v to v to 
+                                       <n>spring.fv.npz
+-n, --number          Interger       How many velocities, 41 by default
+'''
+
+
+__needed__ = ('r12', 'r23', 'r31', 'free_energy', 'post_energy', 'force2',
+              'force3')
+__derived__ = ('prob1', 'prob2', 'prob3', 'mean_force', 'atp_flux',
+               'duty_ratio')
+
+
+class Usage(Exception):
+    """Passes mesages back to the command line"""
+    def __init__(self, msg):
+        self.msg = msg
+
+
+def steady_state(r12, r23, r31, free_energy, post_energy):
+    """Solve the unbound (1), loosely (2) and tightly (3) bound cycle for
+    its steady state, point by point over arrays of any shape
+
+    The reverse rates follow from the forward ones by detailed balance,
+    r_forward / r_backward = exp(G_next - G_prev) in units of RT, as in
+    KineticsCuts.bert_data, with the unbound free energy 0 and r13 taken as
+    0 (Tanner, 2007 pg 1209). Each state's share is then the sum over the
+    spanning trees of the cycle leading into it. Every term is scaled by
+    exp(-max(0, G2, G3)) so that the large free energies at far off binding
+    sites don't overflow.
+    Takes:
+        r12, r23, r31: forward transition rates
+        free_energy, post_energy: free energies of states 2 and 3, RT
+    Returns:
+        prob1, prob2, prob3: chance of being in each state
+    """
+    (r12, r23, r31) = [np.asarray(r, dtype=float) for r in (r12, r23, r31)]
+    g_2 = np.asarray(free_energy, dtype=float)
+    g_3 = np.asarray(post_energy, dtype=float)
+    g_max = np.maximum(0, np.maximum(g_2, g_3))
+    # Written out with r21 = r12 * exp(G2) and r32 = r23 * exp(G3 - G2)
+    prob1 = (r12 * r31 * np.exp(g_2 - g_max) + r23 * r31 * np.exp(-g_max) +
+             r12 * r23 * np.exp(g_3 - g_max))
+    prob2 = r12 * (r23 * np.exp(g_3 - g_2 - g_max) + r31 * np.exp(-g_max))
+    prob3 = r12 * r23 * np.exp(-g_max)
+    # Where nothing binds and the scaling underflows, all stay unbound
+    prob1 = np.where(prob1 + prob2 + prob3 > 0, prob1, 1.0)
+    total = prob1 + prob2 + prob3
+    return (prob1 / total, prob2 / total, prob3 / total)
+
+def kinetic_properties(r12, r23, r31, free_energy, post_energy, force2,
+                       force3):
+    """Return a dict of the steady state properties: the occupancies prob1,
+    prob2 and prob3, the mean_force of the bound states weighted by their
+    occupancy, the atp_flux of one ATP per trip around the cycle (the flux
+    from 3 to 1), and the duty_ratio, the share of time spent bound"""
+    (prob1, prob2, prob3) = steady_state(r12, r23, r31, free_energy,
+                                         post_energy)
+    mean_force = (prob2[..., None] * np.asarray(force2, dtype=float) +
+                  prob3[..., None] * np.asarray(force3, dtype=float))
+    return {'prob1': prob1,
+            'prob2': prob2,
+            'prob3': prob3,
+            'mean_force': mean_force,
+            'atp_flux': prob3 * np.asarray(r31, dtype=float),
+            'duty_ratio': prob2 + prob3}
+
+def moving_steady_state(r12, r23, r31, free_energy, post_energy, spacing,
+                        velocities):
+    """Solve the cycle for its steady state while the binding sites slide
+    past at constant velocities, for every row of a grid at once
+
+    In the frame moving with the sites the bound shares obey
+    v d(p2, p3)/dx = Q (p2, p3) + (r12, 0), with p1 = 1 - p2 - p3 and the
+    same rates and detailed balance as steady_state. This is marched along
+    x from the edge the sites come in at, where they come in unbound, by
+    implicit upwind steps, each a 2x2 solve over all velocities and rows
+    together. A velocity of 0 gives steady_state.
+    Takes:
+        r12, r23, r31, free_energy, post_energy: (ny, nx) grids
+        spacing: the even spacing of the grid's x locations, nm
+        velocities: (V,) speeds the sites move at along x, nm per unit of
+            the rates' time, positive lengthening
+    Returns:
+        prob1, prob2, prob3: (V, ny, nx) chances of being in each state
+    """
+    (r12, r23, r31) = [np.asarray(r, dtype=float) for r in (r12, r23, r31)]
+    (g_2, g_3) = (np.asarray(free_energy, dtype=float),
+                  np.asarray(post_energy, dtype=float))
+    velocities = np.asarray(velocities, dtype=float).reshape(-1)
+    # Reverse rates, those past exp(100) being as good as infinite
+    r21 = r12 * np.exp(np.minimum(g_2, 100))
+    r32 = r23 * np.exp(np.minimum(g_3 - g_2, 100))
+    # d(p2, p3)/dt = a (p2, p3) + (r12, 0)
+    a = ((-(r12 + r21 + r23), r32 - r12), (r23, -(r32 + r31)))
+    probs = np.zeros((2, len(velocities)) + r12.shape)
+    for sign in (1, -1):
+        moving = np.flatnonzero(sign * velocities > 0)
+        if len(moving) == 0:
+            continue
+        # Step length over speed, the time a site takes to cross a step
+        h_v = (spacing / abs(velocities[moving]))[:, None]
+        order = range(r12.shape[-1])[::sign]
+        bound = np.zeros((2, len(moving), r12.shape[0]))
+        for i in order:
+            # (I - h_v a) bound_i = bound_(i-1) + h_v (r12, 0), by Cramer
+            m11 = 1 - h_v * a[0][0][:, i]
+            m12 = -h_v * a[0][1][:, i]
+            m21 = -h_v * a[1][0][:, i]
+            m22 = 1 - h_v * a[1][1][:, i]
+            rhs1 = bound[0] + h_v * r12[:, i]
+            det = m11 * m22 - m12 * m21
+            bound = np.array(((rhs1 * m22 - m12 * bound[1]) / det,
+                              (m11 * bound[1] - m21 * rhs1) / det))
+            # Mixed indexing puts the velocity axis first
+            probs[:, moving, :, i] = bound.transpose(1, 0, 2)
+    still = np.flatnonzero(velocities == 0)
+    if len(still) > 0:
+        probs[:, still] = np.array(steady_state(r12, r23, r31, g_2,
+                                                g_3)[1:])[:, None]
+    return (1 - probs[0] - probs[1], probs[0], probs[1])
+
+def force_velocity(r12, r23, r31, free_energy, post_energy, force2, force3,
+                   spacing, velocities):
+    """Return the steady mean [x,y] force per crossbridge, as a (V, ny, 2)
+    array, and ATPase, the mean flux from 3 to 1 per crossbridge, as a
+    (V, ny) array, at each velocity for each row of (ny, nx) grids, with
+    the binding sites spread evenly over the grid's x locations; see
+    moving_steady_state"""
+    (prob1, prob2, prob3) = moving_steady_state(
+        r12, r23, r31, free_energy, post_energy, spacing, velocities)
+    force = (np.einsum('vyx,yxk->vyk', prob2, np.asarray(force2, dtype=float))
+             + np.einsum('vyx,yxk->vyk', prob3,
+                         np.asarray(force3, dtype=float)))
+    atpase = (prob3 * np.asarray(r31, dtype=float)).mean(axis=-1)
+    return (force / prob1.shape[-1], atpase)
+
+def force_velocity_stored(store, velocities):
+    """Return the force and ATPase at each velocity and d10 row of a Storage,
+    as force_velocity does"""
+    return force_velocity(store.get('r12'), store.get('r23'),
+                          store.get('r31'), store.get('free_energy'),
+                          store.get('post_energy'), store.get('force2'),
+                          store.get('force3'), store.get('x_range')[2],
+                          velocities)
+
+def write_properties(store):
+    """Work out the steady state properties of a Storage and write them to
+    it, returning their names, or None if it lacks the properties needed"""
+    if not all(prop in store.list() for prop in __needed__):
+        return None
+    props = kinetic_properties(*[store.get(prop) for prop in __needed__])
+    for prop in __derived__:
+        store.write(prop, props[prop].tolist())
+    return __derived__
+
+
+def main(argv=None):
+    """Parse options and add the kinetic properties to a store"""
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hx:v:n:",
+                                       ["help", "crossbridge=", "velocity=",
+                                        "number="])
+        except getopt.error, msg:
+            raise Usage(msg)
+        # Default values, retained for non-passed options
+        xbtype = 4
+        max_velocity = None # Adds the steady state properties instead
+        n_velocities = 41
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(__help_message__)
+            elif option in ("-x", "--crossbridge"):
+                if value in ("1", "2", "4"):
+                    xbtype = int(value)
+                else:
+                    raise Usage("Allowed xb types are 1, 2 and 4 (spring)")
+            elif option in ("-v", "--velocity"):
+                max_velocity = abs(float(value))
+            elif option in ("-n", "--number"):
+                n_velocities = int(value)
+        store = Storage.Storage(xbtype)
+        if max_velocity is not None:
+            velocities = np.linspace(-max_velocity, max_velocity,
+                                     n_velocities)
+            (force, atpase) = force_velocity_stored(store, velocities)
+            np.savez_compressed(str(xbtype) + "spring.fv.npz",
+                                velocities=velocities,
+                                d10=np.arange(*store.get('y_range')),
+                                force=force, atpase=atpase)
+            slowest = np.argmin(abs(velocities))
+            print ("Axial force at velocity " + str(velocities[slowest]) +
+                   " from " + str(force[slowest, :, 0].min()) + " to " +
+                   str(force[slowest, :, 0].max()))
+            return
+        if write_properties(store) is None:
+            raise Usage("Stored crossbridge lacks some of " +
+                        ", ".join(__needed__))
+        store.save()
+        duty = np.asarray(store.get('duty_ratio'))
+        print ("Duty ratio from " + str(np.nanmin(duty)) + " to " +
+               str(np.nanmax(duty)) + ", peak ATP flux " +
+               str(np.nanmax(store.get('atp_flux'))))
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""
+Lattice.py
+
+A half-sarcomere of compliant thick and thin filaments, coupled by the
+crossbridges on the thick filaments binding to sites on the thin ones.
+"""
+
+import sys
+import numpy as np
+import numpy.random as random
+import scipy.sparse as sparse
+from scipy.sparse.linalg import splu
+import LookupCrossbridge
+from CreateData import d10_to_fil_sep
+
+class HalfSarcomere():
+    """Thick filaments running from the M-line, thin ones from the Z-line.
+
+    Each thick filament carries a crown of heads every crown_spacing, one
+    head facing each of its n_thin thin filaments, and each thin filament
+    carries a binding site every site_spacing. The filaments are chains of
+    linear springs between those nodes, held at the M-line and Z-line, and
+    the d10 lattice spacing sets how far each head is from the thin
+    filament it faces. Unbound heads only try sites their crowns are within
+    reach of, by default the axial range of the lookup tables. All heads'
+    forces are found in one batched call to xb.force_batch per bound state,
+    at the offset from each head's crown to its binding site, so that with
+    a LookupCrossbridge no minimizations are needed at all. The node
+    displacements balancing those forces are found by iteration, each
+    iteration one back substitution with a sparse factorization of the
+    filament stiffness, made when the lattice is, plus that of the bound
+    heads, made once a solve.
+    Use step(dt) to run the heads' kinetics for dt and rebalance the forces
+        solve() to rebalance after moving the Z-line (z_line)
+        axial_force() for the force the half-sarcomere bears
+        counts() for the number of heads in each state"""
+
+    def __init__(self, xb=None, z_line=1250.0, d10=37.0, n_thick=1,
+                 n_thin=6, n_crowns=60, crown_spacing=14.3, bare_zone=58.0,
+                 n_sites=90, site_spacing=12.3, k_thick=2020.0,
+                 k_thin=1743.0, reach=None):
+        """Build the lattice, with every head unbound
+        Takes:
+            xb: something with force_batch, r12_batch, r23_batch and
+                r31_batch methods, a Crossbridge or by default the
+                LookupCrossbridge of the stored 4 spring tables
+            z_line: distance from the M-line to the Z-line, nm
+            d10: lattice spacing, nm, converted to a filament separation
+            n_thick: number of thick filaments
+            n_thin: number of thin filaments each thick filament faces
+            n_crowns: crowns, and so heads per thin filament faced, on each
+                thick filament
+            crown_spacing, bare_zone: crown spacing, and the distance of the
+                first crown from the M-line, nm
+            n_sites, site_spacing: binding sites on each thin filament, and
+                their spacing starting from the Z-line, nm
+            k_thick, k_thin: stiffness of the filament segments between
+                nodes, pN/nm
+            reach: (low, high) axial offsets from its crown to a site at
+                which a head may bind, by default the x range of xb's
+                tables if it has them, else any offset
+        """
+        if xb is None:
+            xb = LookupCrossbridge.LookupCrossbridge(4)
+        self.xb = xb
+        if reach is None and hasattr(xb, 'x_locs'):
+            reach = (xb.x_locs[0], xb.x_locs[-1])
+        self.reach = reach
+        self.r12_trials = 100 # Only used by Monte Carlo r12s
+        self.z_line = z_line
+        self.fil_sep = float(d10_to_fil_sep(d10))
+        self.n_crowns = n_crowns
+        self.n_sites = n_sites
+        # Rest locations of every thick node, then every thin node
+        n_thin_fils = n_thick * n_thin
+        self.n_thick_nodes = n_thick * n_crowns
+        self._thick_rest = np.tile(bare_zone + crown_spacing *
+                                   np.arange(n_crowns), n_thick)
+        self._thin_offsets = np.tile(site_spacing * np.arange(1, n_sites + 1),
+                                     n_thin_fils)
+        self.displace = np.zeros(self.n_thick_nodes + n_thin_fils * n_sites)
+        # Each head's crown node and the thin filament it faces
+        self.head_node = np.repeat(np.arange(self.n_thick_nodes), n_thin)
+        self.head_thin = (np.repeat(np.arange(n_thick), n_crowns * n_thin) *
+                          n_thin + np.tile(np.arange(n_thin),
+                                           n_thick * n_crowns))
+        self.states = np.ones(len(self.head_node), dtype=np.int8)
+        self.bound_site = np.zeros(len(self.head_node), dtype=int)
+        # Chains of springs, the first node of each held at its end
+        stiff = np.concatenate((np.repeat(float(k_thick), self.n_thick_nodes),
+                                np.repeat(float(k_thin), n_thin_fils *
+                                          n_sites)))
+        first = np.concatenate((np.arange(0, self.n_thick_nodes, n_crowns),
+                                self.n_thick_nodes +
+                                np.arange(0, n_thin_fils * n_sites, n_sites)))
+        to_prev = np.ones(len(stiff), dtype=bool)
+        to_prev[first] = False
+        nodes = np.arange(len(stiff))
+        diag = stiff.copy()
+        diag[nodes[to_prev] - 1] += stiff[to_prev]
+        off_diag = -stiff[to_prev]
+        self.stiffness = sparse.csc_matrix(
+            (np.concatenate((diag, off_diag, off_diag)),
+             (np.concatenate((nodes, nodes[to_prev], nodes[to_prev] - 1)),
+              np.concatenate((nodes, nodes[to_prev] - 1, nodes[to_prev])))),
+            shape=(len(stiff), len(stiff)))
+        self._factor = splu(self.stiffness)
+        self.time = 0.0
+
+    def thick_locs(self):
+        """Return the axial location of every crown"""
+        return self._thick_rest + self.displace[:self.n_thick_nodes]
+
+    def thin_locs(self):
+        """Return the axial location of every binding site"""
+        return (self.z_line - self._thin_offsets +
+                self.displace[self.n_thick_nodes:])
+
+    def _offsets(self, heads, sites):
+        """Return the (N, 2) head locations, relative to their crowns, that
+        binding heads to sites (indices into all sites) would give"""
+        return np.column_stack((self.thin_locs()[sites] -
+                                self.thick_locs()[self.head_node[heads]],
+                                np.repeat(self.fil_sep, len(heads))))
+
+    def _reachable_sites(self, heads):
+        """Return the site on each head's thin filament, where it is now,
+        nearest the middle of the head's reach (its crown, if reach is
+        unlimited), and whether that site is within reach at all"""
+        crowns = self.thick_locs()[self.head_node[heads]]
+        offsets = (self.thin_locs().reshape(-1, self.n_sites)[
+            self.head_thin[heads]] - crowns[:, None])
+        if self.reach is None:
+            index = abs(offsets).argmin(axis=1)
+            return (self.head_thin[heads] * self.n_sites + index,
+                    np.ones(len(heads), dtype=bool))
+        (low, high) = self.reach
+        in_reach = (offsets >= low) & (offsets <= high)
+        index = np.where(in_reach, abs(offsets - 0.5 * (low + high)),
+                         np.inf).argmin(axis=1)
+        return (self.head_thin[heads] * self.n_sites + index,
+                in_reach.any(axis=1))
+
+    def xb_forces(self):
+        """Return the indices of the bound heads, and the (N, 2) axial and
+        radial forces each exerts on its binding site"""
+        bound = np.flatnonzero(self.states > 1)
+        return (bound, self._forces_at(bound, self._offsets(
+            bound, self.bound_site[bound])))
+
+    def _forces_at(self, bound, offsets):
+        """Return the (N, 2) forces of the bound heads at the given offsets
+        """
+        forces = np.zeros((len(bound), 2))
+        for state in (2, 3):
+            in_state = self.states[bound] == state
+            if in_state.any():
+                forces[in_state] = self.xb.force_batch(offsets[in_state],
+                                                       state)
+        return forces
+
+    def _head_stiffness(self, bound, d_x=0.05):
+        """Return the axial stiffness of each bound head, by a central
+        difference of its axial force over 2 d_x, taken as no less than 0
+        """
+        offsets = self._offsets(bound, self.bound_site[bound])
+        shift = np.array([d_x, 0.0])
+        stiff = (self._forces_at(bound, offsets + shift)[:, 0] -
+                 self._forces_at(bound, offsets - shift)[:, 0]) / (2 * d_x)
+        return np.maximum(stiff, 0)
+
+    def solve(self, tol=1e-6, max_iter=50):
+        """Find the node displacements where the filaments balance the
+        crossbridges' axial forces, returning the iterations taken; each
+        iteration corrects the displacements by the remaining imbalance over
+        the filament stiffness plus that of the bound heads, so that heads
+        stiffer than the filaments holding them don't set it oscillating"""
+        bound = np.flatnonzero(self.states > 1)
+        factor = self._factor
+        if len(bound) > 0:
+            stiff = self._head_stiffness(bound)
+            (sites, crowns) = (self.n_thick_nodes + self.bound_site[bound],
+                               self.head_node[bound])
+            heads = sparse.csc_matrix(
+                (np.concatenate((stiff, stiff, -stiff, -stiff)),
+                 (np.concatenate((sites, crowns, sites, crowns)),
+                  np.concatenate((sites, crowns, crowns, sites)))),
+                shape=self.stiffness.shape)
+            factor = splu((self.stiffness + heads).tocsc())
+        for iteration in range(1, max_iter + 1):
+            (bound, forces) = self.xb_forces()
+            load = np.zeros(len(self.displace))
+            # The forces are +dE/dh, and h runs from crown to site, so
+            # each head pulls its site back and its crown forward
+            np.add.at(load, self.n_thick_nodes + self.bound_site[bound],
+                      -forces[:, 0])
+            np.add.at(load, self.head_node[bound], forces[:, 0])
+            new_displace = self.displace + factor.solve(
+                load - self.stiffness.dot(self.displace))
+            change = abs(new_displace - self.displace).max()
+            self.displace = new_displace
+            if change < tol:
+                break
+        return iteration
+
+    def step(self, dt):
+        """Advance the heads' kinetics by dt, then rebalance the forces;
+        unbound heads try the site within their reach nearest its middle,
+        those with none in reach staying unbound, and each head makes at
+        most one transition, so dt should be short next to the rates"""
+        heads = np.arange(len(self.states))
+        (near, in_reach) = self._reachable_sites(heads)
+        sites = np.where(self.states == 1, near, self.bound_site)
+        offsets = self._offsets(heads, sites)
+        rates = np.zeros(len(heads))
+        for (state, rate_func) in ((1, lambda b: self.xb.r12_batch(
+                                        b, self.r12_trials)),
+                                   (2, self.xb.r23_batch),
+                                   (3, self.xb.r31_batch)):
+            in_state = self.states == state
+            if state == 1:
+                in_state &= in_reach
+            if in_state.any():
+                rates[in_state] = rate_func(offsets[in_state])
+        moving = random.rand(len(heads)) < -np.expm1(-rates * dt)
+        binding = moving & (self.states == 1)
+        self.bound_site[binding] = sites[binding]
+        self.states[moving] = self.states[moving] % 3 + 1
+        self.time += dt
+        return self.solve()
+
+    def axial_force(self):
+        """Return the axial force the half-sarcomere bears, the sum of the
+        bound crossbridges' axial forces on the thin filaments (positive
+        toward the Z-line)"""
+        return -float(self.xb_forces()[1][:, 0].sum())
+
+    def counts(self):
+        """Return the number of heads in states 1, 2 and 3"""
+        return np.bincount(self.states, minlength=4)[1:]
+
+    def bound_energies(self):
+        """Return the indices of the bound heads, and the free energy of
+        each at its current offset"""
+        bound = np.flatnonzero(self.states > 1)
+        energies = np.zeros(len(bound))
+        offsets = self._offsets(bound, self.bound_site[bound])
+        for state in (2, 3):
+            in_state = self.states[bound] == state
+            if in_state.any():
+                energies[in_state] = self.xb.free_energy_batch(
+                    offsets[in_state], state)
+        return (bound, energies)
+
+
+def single_head_check(xb=None, stiffnesses=(2020.0, 300.0, 100.0, 50.0)):
+    """Bind one head tightly, at the site in its reach when the lattice is
+    at rest, and balance the lattice at each filament stiffness; as the
+    filaments give way to the head its energy must fall. Returns a list of
+    (stiffness, energy before, energy after, iterations) tuples."""
+    results = []
+    for k_fil in stiffnesses:
+        lattice = HalfSarcomere(xb, k_thick=k_fil, k_thin=k_fil)
+        head = len(lattice.states) // 2 # On a crown midway along
+        lattice.states[head] = 3
+        lattice.bound_site[head] = lattice._reachable_sites(
+            np.array([head]))[0][0]
+        before = lattice.bound_energies()[1][0]
+        iterations = lattice.solve()
+        results.append((k_fil, before, lattice.bound_energies()[1][0],
+                        iterations))
+    return results
+
+
+def main(argv=None):
+    """Run the single head check, exiting with 1 if an energy rises"""
+    failed = False
+    for (k_fil, before, after, iterations) in single_head_check():
+        print ("k = %7.1f pN/nm: %8.4f RT to %8.4f RT in %2d iterations" %
+               (k_fil, before, after, iterations))
+        failed = failed or not after < before
+    if failed:
+        print "A head's energy rose as the lattice balanced"
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
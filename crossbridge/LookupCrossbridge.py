@@ -0,0 +1,183 @@
+"""
+LookupCrossbridge.py
+
+A crossbridge that answers from the tables CreateData stores, rather than
+by minimizing its energy, for simulations holding many crossbridges.
+"""
+
+import warnings
+import numpy as np
+import numpy.random as random
+from scipy.interpolate import RectBivariateSpline
+import Storage
+import Crossbridge
+from CreateData import d10_to_fil_sep
+
+class LookupCrossbridge():
+    """A stand-in for a Crossbridge that interpolates its stored properties.
+
+    Every property is interpolated, bilinearly or bicubically, from the
+    grids a CreateData run left in Storage, so each query costs the same
+    small, fixed amount however stiff the springs. Queries are taken in
+    the same head location coordinates as a Crossbridge, with y the
+    filament face to face separation the Storage d10 range was made from.
+    Queries off the stored grid are answered from its nearest edge, with a
+    warning, as the tables say nothing of what lies beyond them. The
+    scalar methods match those of a Crossbridge, and each has a _batch
+    form taking an (N, 2) array of locations.
+    Use error_bound(xb_property) to see how closely a property is known"""
+
+    def __init__(self, xbtype, order=1, store=None):
+        """Load the tables for a type of crossbridge
+        Takes:
+            xbtype: number of springs, 1, 2 or 4, as stored by CreateData
+            order: 1 for bilinear, 3 for bicubic interpolation
+            store: a Storage to read from, instead of the one for xbtype
+        """
+        if order not in (1, 3):
+            raise ValueError("Interpolation order must be 1 or 3")
+        self.order = order
+        if store is None:
+            store = Storage.Storage(xbtype)
+        self.store = store
+        self.config = store.get('config')
+        # A crossbridge of the stored type, for its free energy offsets
+        self.xb = {4: Crossbridge.FourSpring, 2: Crossbridge.TwoSpring,
+                   1: Crossbridge.OneSpring}[xbtype](self.config)
+        self.x_locs = np.arange(*store.get('x_range'))
+        # Storage keeps the y range as d10
+        self.y_locs = d10_to_fil_sep(np.arange(*store.get('y_range')))
+        self._splines = {}
+
+    def _table(self, xb_property):
+        """Return the stored grid of a property, as a (ny, nx, k) array"""
+        table = np.asarray(self.store.get(xb_property), dtype=float)
+        return table.reshape(self.y_locs.size, self.x_locs.size, -1)
+
+    def _interp(self, xb_property, h_locs):
+        """Interpolate a property at an (N, 2) array of locations, giving an
+        (N,) or (N, k) array"""
+        if xb_property not in self._splines:
+            table = self._table(xb_property)
+            self._splines[xb_property] = [
+                RectBivariateSpline(self.y_locs, self.x_locs, table[:, :, i],
+                                    kx=self.order, ky=self.order)
+                for i in range(table.shape[2])]
+        splines = self._splines[xb_property]
+        h_locs = np.asarray(h_locs, dtype=float).reshape(-1, 2)
+        off_grid = ((h_locs[:, 0] < self.x_locs[0]) |
+                    (h_locs[:, 0] > self.x_locs[-1]) |
+                    (h_locs[:, 1] < self.y_locs[0]) |
+                    (h_locs[:, 1] > self.y_locs[-1]))
+        if off_grid.any():
+            warnings.warn(str(off_grid.sum()) + " " + xb_property +
+                          " queries fell off the stored grid and were "
+                          "taken from its edge")
+        x = np.clip(h_locs[:, 0], self.x_locs[0], self.x_locs[-1])
+        y = np.clip(h_locs[:, 1], self.y_locs[0], self.y_locs[-1])
+        values = np.column_stack([spline.ev(y, x) for spline in splines])
+        if len(splines) == 1:
+            return values[:, 0]
+        return values
+
+    def error_bound(self, xb_property):
+        """Estimate the largest interpolation error in a property from the
+        table resolution, using its finite differences along each axis: a
+        bilinear fit errs by at most an eighth of the second differences,
+        and a cubic one by about 5/384ths of the fourth differences"""
+        table = self._table(xb_property)
+        if self.order == 1:
+            (diffs, scale) = (2, 1 / 8.0)
+        else:
+            (diffs, scale) = (4, 5 / 384.0)
+        bound = 0.0
+        for axis in (0, 1):
+            if table.shape[axis] > diffs:
+                bound += scale * abs(np.diff(table, diffs, axis)).max()
+        return float(bound)
+
+    def minimize_energy(self, h_loc, state, guess=None):
+        """The cross-bridge's minimum energy for a given head location and
+        state, and the converter location there if it was stored, else
+        None. The weakly bound converter locations are stored as min_conv2,
+        and serve for the unbound state too, and the tightly bound ones as
+        min_conv3. The guess is only accepted to match
+        Crossbridge.minimize_energy."""
+        (energy, min_conv) = self.minimize_energy_batch([h_loc], state)
+        if min_conv is not None:
+            min_conv = min_conv[0]
+        return (float(energy[0]), min_conv)
+
+    def minimize_energy_batch(self, h_locs, state, guess=None):
+        """Return the minimum energies, and converter locations or None, for
+        an (N, 2) array of head locations"""
+        if state == 1:
+            energies = self._interp('energy', h_locs)
+        else:
+            energies = (self.free_energy_batch(h_locs, state) -
+                        self.xb.free_energy_offset(state))
+        conv_name = 'min_conv3' if state == 3 else 'min_conv2'
+        if conv_name in self.store.list():
+            return (energies, self._interp(conv_name, h_locs))
+        return (energies, None)
+
+    def free_energy(self, h_loc, state, guess=None):
+        """Return the free energy in the xb with the given parameters"""
+        return float(self.free_energy_batch([h_loc], state)[0])
+
+    def free_energy_batch(self, h_locs, state, guess=None):
+        """Return the free energies in the xb for an (N, 2) array of h_locs"""
+        if state == 1:
+            return np.zeros(len(np.reshape(h_locs, (-1, 2))))
+        elif state == 2:
+            return self._interp('free_energy', h_locs)
+        elif state == 3:
+            return self._interp('post_energy', h_locs)
+        warnings.warn("Improper value for crossbridge state")
+
+    def force(self, h_loc, state, guess=None):
+        """From the head loc, the force vector being exerted by the XB"""
+        return [float(f) for f in self.force_batch([h_loc], state)[0]]
+
+    def force_batch(self, h_locs, state, guess=None):
+        """From an (N, 2) array of head locs, the (N, 2) force vectors"""
+        return self._interp('force' + str(state), h_locs)
+
+    def r12(self, b_site, trials=None):
+        """Give the prob of binding at a b_site; trials is only accepted to
+        match Crossbridge.r12, the table was made with its own"""
+        return float(self.r12_batch([b_site])[0])
+
+    def r12_batch(self, b_sites, trials=None):
+        """Give the prob of binding at each of an (N, 2) array of b_sites"""
+        return np.clip(self._interp('r12', b_sites), 0, 1)
+
+    def bind_or_not(self, b_site):
+        """Given a binding site, bind or don't"""
+        return bool(self.r12(b_site) > random.rand())
+
+    def bind_or_not_batch(self, b_sites, trials=1):
+        """Given an (N, 2) array of binding sites, return an (N, trials)
+        array of whether each trial binds"""
+        rates = self.r12_batch(b_sites)
+        return rates[:, None] > random.rand(len(rates), trials)
+
+    def r23(self, b_site):
+        """Given a binding site, b_site, to which a myosin head is loosely
+        bound, return a probability of transition to a tightly bound state
+        """
+        return float(self.r23_batch([b_site])[0])
+
+    def r23_batch(self, b_sites):
+        """Return the r23 rates for an (N, 2) array of binding sites"""
+        return self._interp('r23', b_sites)
+
+    def r31(self, b_site):
+        """Given a binding site, b_site, to which a myosin head is tightly
+        bound, return a probability of transition to an unbound state
+        """
+        return float(self.r31_batch([b_site])[0])
+
+    def r31_batch(self, b_sites):
+        """Return the r31 rates for an (N, 2) array of binding sites"""
+        return self._interp('r31', b_sites)
@@ -11,6 +11,7 @@ import cPickle as pickle
 import numpy as np
 from numpy import pi, radians
 import Crossbridge
+import CreateData
 
 def main():
     config = {
@@ -73,19 +74,12 @@ def main():
     energy = np.zeros((2, y_locs.size, x_locs.size))
     springs = 4
     
-    xit, yit, sit = 0, 0, 0
-    for state in [2]:
-        for y in y_locs:
-            for x in x_locs:
-                h_locs[sit, yit, xit] = [x, y]
-                energy[sit, yit, xit], c_locs[sit, yit, xit] = \
-                                xb.minimize_energy((x, y), state)
-                xit += 1
-            yit += 1
-            xit = 0
-        sit += 1
-        yit = 0
-        xit = 0
+    # Walk each state's grid with warm starts, seeding the strongly bound 
+    # state with the weakly bound solution
+    h_locs[:] = np.dstack(np.meshgrid(x_locs, y_locs))
+    energy[0], c_locs[0] = CreateData.sweep_minimize(xb, x_locs, y_locs, 2)
+    energy[1], c_locs[1] = CreateData.sweep_minimize(xb, x_locs, y_locs, 3, 
+                                                     guess=c_locs[0])
     
     
     file_name = "NodeBoxData.pkl"
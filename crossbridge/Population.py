@@ -0,0 +1,130 @@
+"""
+Population.py
+
+Runs a population of crossbridges through their cycle, unbound (1) to
+loosely bound (2) to tightly bound (3) and back to unbound, using the
+rates and forces CreateData stored for a type of crossbridge.
+"""
+
+import numpy as np
+import numpy.random as random
+import LookupCrossbridge
+
+class Population():
+    """Many independent crossbridges, each facing its own binding site.
+
+    The state of each crossbridge and the offset of its binding site from
+    its thick filament crown are held in arrays. The rates and forces at
+    each offset are interpolated from the stored tables once, and again only
+    when the sites move, so that a step costs a few array operations however
+    many crossbridges there are. The stored r12, r23 and r31 are taken as
+    rates per unit of time, and only crossbridges in states 2 and 3 exert
+    force, that of the stored force2 and force3.
+    Use tau_leap(dt) or gillespie(dt) to advance the population
+        shift(d_x) to slide the binding sites along the thick filament
+        force() and counts() to see where the population stands
+        run(t_end, dt) to record a time series"""
+
+    def __init__(self, offsets, xbtype=4, lookup=None):
+        """Set up a population, all unbound
+        Takes:
+            offsets: (N, 2) array of the [x,y] binding site locations each
+                crossbridge faces, as head locations in the stored tables
+            xbtype: number of springs, 1, 2 or 4, of the stored tables to use
+            lookup: a LookupCrossbridge to use instead of the stored tables
+        """
+        if lookup is None:
+            lookup = LookupCrossbridge.LookupCrossbridge(xbtype)
+        self.lookup = lookup
+        self.offsets = np.array(offsets, dtype=float).reshape(-1, 2)
+        self.states = np.ones(len(self.offsets), dtype=np.int8)
+        self.time = 0.0
+        self._update_sites()
+
+    def _update_sites(self):
+        """Look up the rates out of, and forces in, each state at each site
+        """
+        n_xb = len(self.offsets)
+        self.rates = np.column_stack((
+            self.lookup.r12_batch(self.offsets),
+            self.lookup.r23_batch(self.offsets),
+            self.lookup.r31_batch(self.offsets)))
+        self.forces = np.zeros((n_xb, 3, 2))
+        self.forces[:, 1] = self.lookup.force_batch(self.offsets, 2)
+        self.forces[:, 2] = self.lookup.force_batch(self.offsets, 3)
+        self._leap = (None, None) # dt and the chance of leaving each state
+
+    def shift(self, d_x):
+        """Slide every binding site d_x along the thick filament"""
+        self.offsets[:, 0] += d_x
+        self._update_sites()
+
+    def tau_leap(self, dt):
+        """Advance dt, with each crossbridge moving on to its next state with
+        the probability it would leave its current state in that time; dt
+        should be short next to the fastest rate, as at most one transition
+        is made per crossbridge"""
+        if self._leap[0] != dt:
+            self._leap = (dt, -np.expm1(-self.rates * dt).ravel())
+        leave = self._leap[1][3 * np.arange(len(self.states)) + 
+                              self.states - 1]
+        moving = np.flatnonzero(random.rand(len(self.states)) < leave)
+        self.states[moving] = self.states[moving] % 3 + 1
+        self.time += dt
+
+    def gillespie(self, dt):
+        """Advance dt exactly, running each crossbridge through as many
+        transitions as its waiting times allow; as crossbridges don't
+        interact, and waiting times are memoryless, those still waiting at
+        the end of dt needn't be tracked"""
+        waited = np.zeros(len(self.states))
+        active = np.arange(len(self.states))
+        while len(active) > 0:
+            rates = self.rates[active, self.states[active] - 1]
+            with np.errstate(divide='ignore'):
+                waits = random.exponential(1.0, len(active)) / rates
+            firing = waited[active] + waits < dt
+            active = active[firing]
+            waited[active] += waits[firing]
+            self.states[active] = self.states[active] % 3 + 1
+        self.time += dt
+
+    def force(self):
+        """Return the total [x,y] force exerted by the bound crossbridges"""
+        return self.forces[np.arange(len(self.states)),
+                           self.states - 1].sum(axis=0)
+
+    def counts(self):
+        """Return the number of crossbridges in states 1, 2 and 3"""
+        return np.bincount(self.states, minlength=4)[1:]
+
+    def run(self, t_end, dt, method='tau_leap', record_every=1):
+        """Advance the population to time t_end in steps of dt
+        Takes:
+            t_end: time to run until
+            dt: time step
+            method: 'tau_leap' or 'gillespie'
+            record_every: steps between records
+        Returns:
+            times: (T,) array of the times recorded at
+            counts: (T, 3) array of the number in each state
+            forces: (T, 2) array of the total [x,y] force
+        """
+        step = {'tau_leap': self.tau_leap, 'gillespie': self.gillespie}[method]
+        (times, counts, forces) = ([self.time], [self.counts()],
+                                   [self.force()])
+        n_steps = int(round((t_end - self.time) / dt))
+        for i in range(1, n_steps + 1):
+            step(dt)
+            if i % record_every == 0:
+                times.append(self.time)
+                counts.append(self.counts())
+                forces.append(self.force())
+        return (np.array(times), np.array(counts), np.array(forces))
+
+
+def uniform_sites(n_xb, x_low, x_high, fil_sep):
+    """Return an (n_xb, 2) array of binding sites spread evenly at random
+    from x_low to x_high along a thin filament fil_sep from the thick"""
+    return np.column_stack((random.uniform(x_low, x_high, n_xb),
+                            np.repeat(float(fil_sep), n_xb)))
@@ -0,0 +1,90 @@
+"""
+ResultCache.py
+
+A directory of finished property grids, filed under a hash of everything
+that went into making them, so that many configs can be kept side by side.
+"""
+
+import os
+import numpy as np
+import Checkpoint
+
+class ResultCache():
+    """Interface with a cache of calculated crossbridge properties.
+
+    Each property grid is kept as a .npy file named by its key, a digest of
+    the xbtype, config, ranges, property, minimizer, version of the code,
+    trials, seed and any adaptive refinement threshold that produced it.
+    When the files add up to more than max_bytes the least recently used
+    are removed. Reading or writing a file marks it as used.
+    Use key(...) to find the key of a property
+        get(key) to read a cached property, None if it isn't there
+        put(key, new_value) to cache a property"""
+
+    def __init__(self, dir_name="xbcache", max_bytes=2**31):
+        """Open, or create, the cache in dir_name, evicting down to 
+        max_bytes in case that has shrunk since it was last used"""
+        self.dir_name = dir_name
+        self.max_bytes = max_bytes
+        if not os.path.isdir(self.dir_name):
+            os.makedirs(self.dir_name)
+        self.evict()
+
+    def key(self, xbtype, config, x_range, y_range, xb_property, minimizer,
+            version, trials=None, seed=None, threshold=None):
+        """Return the key a property is cached under; version is that of the
+        code computing it (CreateData.__version__), trials and seed need
+        only be passed for Monte Carlo properties, and threshold for
+        properties sampled adaptively (see Adaptive)"""
+        return Checkpoint.fingerprint([xbtype, config, x_range, y_range,
+                                       xb_property, minimizer, version,
+                                       trials, seed, threshold])
+
+    def get(self, key):
+        """Return the property cached under key, or None if there isn't one
+        """
+        file_name = os.path.join(self.dir_name, key + ".npy")
+        try:
+            value = np.load(file_name)
+        except IOError: # Not cached, or evicted
+            return None
+        os.utime(file_name, None)
+        return value
+
+    def put(self, key, new_value):
+        """Cache a property under key, then evict down to max_bytes"""
+        file_name = os.path.join(self.dir_name, key + ".npy")
+        temp_name = file_name + "." + str(os.getpid()) + ".tmp"
+        stream = open(temp_name, 'wb')
+        np.save(stream, np.asarray(new_value, dtype=float))
+        stream.close()
+        os.rename(temp_name, file_name)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Remove the least recently used properties, other than keep, until
+        the cache holds no more than max_bytes"""
+        entries = []
+        for file_name in os.listdir(self.dir_name):
+            if file_name.endswith(".npy"):
+                path = os.path.join(self.dir_name, file_name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path,
+                                file_name[:-len(".npy")]))
+        total = sum(entry[1] for entry in entries)
+        for (mtime, size, path, key) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError: # Another process got there first
+                pass
+            total -= size
+
+    def clear(self):
+        """Remove every cached property"""
+        for file_name in os.listdir(self.dir_name):
+            if file_name.endswith(".npy"):
+                os.remove(os.path.join(self.dir_name, file_name))
@@ -4,10 +4,13 @@ Storage.py
 Created by Dave Williams on 2009-06-28.
 """
 
+import os
+import fcntl
 import yaml
 import cPickle as pickle
 import datetime
 import warnings
+import numpy as np
 
 class Storage():
     """Interface with a stored set of crossbridge data.
@@ -15,12 +18,27 @@ class Storage():
     Use list() to see what properties are currently stored
         get(xb_property) to access properties
         write(xb_property, new_value) change properties
-        save() to save to disk"""
+        save() to save to disk
     
-    def __init__(self, xbtype, config=None, x_range=None, y_range=None, protocol="pickle"):
+    Three protocols are understood: "pickle" and "yaml" keep everything in 
+    one <n>spring.pkl or .yml file, while "npy" keeps each grid property as 
+    its own .npy array in a <n>spring.npy directory, next to a small pickled
+    header of the base attributes and any scalar properties. The arrays are 
+    only opened, memory mapped, when a property is first asked for, so an 
+    npy store opens in milliseconds however much it holds."""
+    
+    base_attributes = ("xbtype", "config", "x_range", "y_range", "timestamp")
+    
+    def __init__(self, xbtype, config=None, x_range=None, y_range=None, 
+                 protocol=None):
         """ Parse the variables and deal with the four cases in which 
         Storage will be used, here is an outline of the process:
-         - construct the file name from the number of springs and protocol
+         - construct the file name from the number of springs and protocol,
+           as an absolute path so that the npy arrays opened lazily by get
+           and the lock taken by save stay with this store if the working
+           directory changes; if no protocol is given, use whichever file
+           is there, looking for npy, then pickle, then yaml, and use
+           pickle for a new file
          - try to read in the file
          - if that fails (because the file doesn't exist)
             - and params were passed (so we will be wanting to write data 
@@ -28,22 +46,29 @@ class Storage():
             - and no params were passed (because we are really only reading 
               the file), then throw an exception and get out of dodge
          - if params were passed and any of them don't match our file, trash
-           the old ones from the file and use the new ones
+           the old ones from the file and use the new ones; if only the 
+           ranges have changed, and some of the stored grid points lie on 
+           the new grid, keep those points instead (see __regrid__)
         """
+        self.file_name = os.path.abspath(str(xbtype)+"spring.")
+        if protocol is None:
+            protocol = "pickle"
+            for (ext, file_protocol) in (("yml", "yaml"), ("pkl", "pickle"),
+                                         ("npy", "npy")):
+                if os.path.exists(self.file_name+ext):
+                    protocol = file_protocol
         self.protocol = protocol
-        self.file_name = str(xbtype)+"spring."
+        self.arrays = {} # npy properties, None until first opened
+        self.dirty = set() # properties written since last saved
+        self.trashed = False # True when the stored data is to be replaced
+        self.partial = set() # properties missing points, as NaNs
+        if self.protocol not in ("npy", "pickle", "yaml"):
+            warnings.warn("Unrecognized file protocol, aborting")
+            return
         ## Read in file, or create if needed
         try:
-            if self.protocol == "pickle":
-                stream = open(self.file_name+"pkl", 'r')
-                self.data = pickle.load(stream)
-            elif self.protocol == "yaml":
-                stream = open(self.file_name+"yml", 'r')
-                self.data = yaml.load(stream)
-            else:
-                warnings.warn("Unrecognized file protocol, aborting")
-                return
-            stream.close()
+            (self.data, array_names) = self._read(self.protocol)
+            self.arrays = dict.fromkeys(array_names)
         except IOError: # File doesn't exist
             if config is not None: # Passed params, in write mode
                 msg = ("\n Storage file " + self.file_name + 
@@ -67,54 +92,236 @@ class Storage():
             self.__trash__(xbtype, config, x_range, y_range)
         if (config is not None) and (self.get('x_range') != x_range or 
             self.get('y_range') != y_range):
-            msg = "\n Range has changed, trashing old data and starting anew"
-            warnings.warn(msg)
-            self.__trash__(xbtype, config, x_range, y_range)
+            if self.__regrid__(x_range, y_range):
+                msg = ("\n Range has changed, keeping the stored points that"
+                       " lie on the new grid")
+                warnings.warn(msg)
+            else:
+                msg = ("\n Range has changed, trashing old data and starting"
+                       " anew")
+                warnings.warn(msg)
+                self.__trash__(xbtype, config, x_range, y_range)
     
     def __trash__(self, xbtype, config, x_range, y_range):
         """Trash the stored data"""
         for key in self.data.keys():
             del self.data[key]
+        self.arrays = {}
+        self.dirty = set()
+        self.trashed = True
+        self.partial = set()
         self.data = {
             "xbtype": xbtype,
             "config": config,
             "x_range": x_range,
             "y_range": y_range
             }
-        
+    
+    def __regrid__(self, x_range, y_range):
+        """Move the stored grid properties onto a new grid, if its points 
+        include some of the old ones: the new grid may extend or shift the 
+        old one, or step an integer fraction as far. Points of the new grid 
+        that weren't stored are filled with NaNs, and their properties are 
+        listed in self.partial. Arrays that aren't over the grid, such as
+        the quadtrees of adaptively sampled properties, index the old grid
+        and so are dropped. Returns False, having changed nothing, if no
+        stored point lies on the new grid."""
+        x_map = _range_map(self.get('x_range'), x_range)
+        y_map = _range_map(self.get('y_range'), y_range)
+        if x_map is None or y_map is None:
+            return False
+        old_shape = (np.arange(*self.get('y_range')).size,
+                     np.arange(*self.get('x_range')).size)
+        shape = (np.arange(*y_range).size, np.arange(*x_range).size)
+        for xb_property in self.list():
+            value = self.get(xb_property)
+            if (xb_property in self.base_attributes or value is None or 
+                np.ndim(value) < 2):
+                continue
+            if np.shape(value)[:2] != old_shape:
+                self.write(xb_property, None)
+                continue
+            old_value = np.asarray(value, dtype=float)
+            new_value = np.empty(shape + old_value.shape[2:])
+            new_value.fill(np.nan)
+            new_value[np.ix_(y_map[1], x_map[1])] = \
+                old_value[np.ix_(y_map[0], x_map[0])]
+            self.write(xb_property, new_value)
+            self.partial.add(xb_property)
+        self.data['x_range'] = x_range
+        self.data['y_range'] = y_range
+        self.trashed = True # The regridded store replaces the old one
+        return True
+    
+    def _read(self, protocol):
+        """Read the stored data, and the names of any npy arrays alongside 
+        it, from the file for a protocol; raises IOError if there isn't one
+        """
+        array_names = []
+        if protocol == "npy":
+            stream = open(os.path.join(self.file_name+"npy", "header.pkl"), 
+                          'rb')
+            for file_name in os.listdir(self.file_name+"npy"):
+                if file_name.endswith(".npy"):
+                    array_names.append(file_name[:-len(".npy")])
+        elif protocol == "pickle":
+            stream = open(self.file_name+"pkl", 'rb')
+        else:
+            stream = open(self.file_name+"yml", 'r')
+        if protocol == "yaml":
+            data = yaml.load(stream)
+        else:
+            data = pickle.load(stream)
+        stream.close()
+        return (data, array_names)
     
     def list(self):
         """List the current xb_properties"""
-        return self.data.keys()
+        return self.data.keys() + self.arrays.keys()
     
     def get(self, xb_property):
-        """Return the stored property for the file, if it exists."""
+        """Return the stored property for the file, if it exists. Properties
+        of an npy store come back as read only, memory mapped arrays."""
         if self.data.has_key(xb_property):
             return self.data.get(xb_property)
+        elif self.arrays.has_key(xb_property):
+            if self.arrays[xb_property] is None:
+                self.arrays[xb_property] = np.load(
+                    os.path.join(self.file_name+"npy", xb_property+".npy"), 
+                    mmap_mode='r')
+            return self.arrays[xb_property]
         else:
             raise Exception("Storage was asked for an unknown xb property")
     
     def write(self, xb_property, new_value):
         """Write a property to the current data; doesn't save to disk."""
-        if xb_property not in ("xbtype", "config", 
-                                "x_range", "y_range", "timestamp"):
+        if xb_property not in self.base_attributes:
+            if xb_property in self.arrays:
+                del self.arrays[xb_property]
             self.data[xb_property] = new_value
+            self.dirty.add(xb_property)
         else:
             warnings.warn("Don't set base attributes, should be instantiated")
     
     def save(self, protocol=None):
-        """Save the current data to a file on disk."""
+        """Save the current data to a file on disk.
+        
+        Several processes may share a store, each writing its own properties
+        and saving them, without losing each other's work: saves are made 
+        one at a time under a lock on <n>spring.lock, and each first merges 
+        in whatever other processes have saved since this store was read, 
+        keeping only its own written properties in their place. Every file 
+        is written to a temporary name and renamed over the old one, so 
+        readers only ever see complete files. (Across nodes this relies on 
+        the shared file system honoring flock.)
+        """
         if protocol is None:
             protocol = self.protocol # Dance with the one who brought ya
-        self.data['timestamp'] = datetime.datetime.today()
-        if protocol == "pickle":
-            stream = open(self.file_name+"pkl", 'w')
-            pickle.dump(self.data, stream)
-        elif protocol == "yaml":
-            stream = open(self.file_name+"yml", 'w')
-            stream.write(yaml.dump(self.data, indent=4))
-        else:
+        if protocol not in ("npy", "pickle", "yaml"):
             warnings.warn("Unrecognized save format, data not saved")
-        stream.close()
+            return
+        lock = open(self.file_name+"lock", 'w')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            # Converting to a new protocol, or trashing, replaces the file
+            rewrite_all = self.trashed or protocol != self.protocol
+            if not rewrite_all:
+                self._merge()
+            self.data['timestamp'] = datetime.datetime.today()
+            if protocol == "npy":
+                self._save_npy(rewrite_all)
+            else:
+                # The single file protocols hold everything as plain lists
+                data = dict(self.data)
+                for xb_property in self.arrays:
+                    data[xb_property] = self.get(xb_property).tolist()
+                if protocol == "pickle":
+                    _atomic_write(self.file_name+"pkl", 
+                                  lambda stream: pickle.dump(data, stream))
+                else:
+                    _atomic_write(self.file_name+"yml", 
+                                  lambda stream: stream.write(
+                                      yaml.dump(data, indent=4)))
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+        self.dirty = set()
+        self.trashed = False
+    
+    def _merge(self):
+        """Take up any properties other processes have saved since this 
+        store was read, other than those written here since"""
+        try:
+            (data, array_names) = self._read(self.protocol)
+        except IOError: # Nothing saved yet
+            return
+        if any(data.get(key) != self.data.get(key) 
+               for key in ("config", "x_range", "y_range")):
+            msg = ("\n Stored parameters were changed by another process, "
+                   "replacing them and their data")
+            warnings.warn(msg)
+            return
+        for (xb_property, value) in data.items():
+            if (xb_property not in self.dirty and 
+                xb_property not in self.base_attributes):
+                self.data[xb_property] = value
+                self.arrays.pop(xb_property, None)
+        for xb_property in array_names:
+            if xb_property not in self.dirty:
+                self.arrays[xb_property] = None # Reopen the newest version
+                self.data.pop(xb_property, None)
     
+    def _save_npy(self, rewrite_all=False):
+        """Save to an npy directory; arrays already there are only rewritten
+        if they have been written to since, or rewrite_all is set"""
+        dir_name = self.file_name+"npy"
+        if not os.path.isdir(dir_name):
+            os.mkdir(dir_name)
+        header = {}
+        for (xb_property, value) in self.data.items():
+            if (xb_property in self.base_attributes or 
+                np.ndim(value) == 0 or value is None):
+                header[xb_property] = value
+            elif xb_property in self.dirty or rewrite_all:
+                _atomic_write(os.path.join(dir_name, xb_property+".npy"), 
+                              lambda stream: np.save(
+                                  stream, np.asarray(value, dtype=float)))
+        # Clear out arrays that are no longer part of the store
+        for file_name in os.listdir(dir_name):
+            xb_property = file_name[:-len(".npy")]
+            if file_name.endswith(".npy") and (xb_property in header or 
+                (rewrite_all and xb_property not in self.arrays and 
+                 xb_property not in self.data)):
+                os.remove(os.path.join(dir_name, file_name))
+        _atomic_write(os.path.join(dir_name, "header.pkl"), 
+                      lambda stream: pickle.dump(header, stream))
 
+
+def _range_map(old_range, new_range):
+    """Find the points of an old [start, stop, step] range that are also 
+    points of a new one. Returns their indices in the old and new ranges, 
+    or None if there are none, or the new step doesn't divide the old"""
+    old_locs = np.arange(*old_range)
+    new_size = np.arange(*new_range).size
+    ratio = float(old_range[2]) / new_range[2]
+    if round(ratio) < 1 or abs(ratio - round(ratio)) > 1e-6:
+        return None
+    new_index = (old_locs - new_range[0]) / new_range[2]
+    if np.any(abs(new_index - np.round(new_index)) > 1e-6):
+        return None
+    new_index = np.round(new_index).astype(int)
+    overlap = (new_index >= 0) & (new_index < new_size)
+    if not overlap.any():
+        return None
+    return (np.flatnonzero(overlap), new_index[overlap])
+
+def _atomic_write(file_name, dump):
+    """Write a file by passing a stream to dump, under a temporary name that
+    is then renamed over file_name, so no one reads a partial file"""
+    temp_name = file_name + "." + str(os.getpid()) + ".tmp"
+    stream = open(temp_name, 'wb')
+    try:
+        dump(stream)
+    finally:
+        stream.close()
+    os.rename(temp_name, file_name)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Surrogate.py
+
+Fits compact tensor product Chebyshev series to the property grids in
+Storage, so that large models can carry a few kilobytes of coefficients
+per property rather than the grids themselves.
+"""
+
+import sys
+import getopt
+import warnings
+import numpy as np
+from numpy.polynomial import chebyshev as cheb
+import Storage
+import Kinetics
+from CreateData import d10_to_fil_sep
+
+
+__help_message__ = '''
+Fits Chebyshev surrogates to stored properties, saving each that meets the
+tolerance as <n>spring.<property>.cheb.npz; exits with 1 if any doesn't:
+Option                Values         Results
+-h, --help                           You see this message
+-x, --crossbridge     1,2,4          Picks the stored crossbridge to fit
+-t, --tolerance       Float          Largest error allowed, as a fraction of
+                                       each property's range
+-m, --max-degree      Interger       Highest degree tried along each axis
+-p, --property        Some strs      No value fits all smooth grid
+                                       properties, some value selects a
+                                       given property
+'''
+
+
+__unsmooth__ = ('r12',) + Kinetics.__derived__ # Monte Carlo noise, or steps
+                                               # no low degree series follows
+
+
+class Usage(Exception):
+    """Passes mesages back to the command line"""
+    def __init__(self, msg):
+        self.msg = msg
+
+
+class ChebyshevSurrogate():
+    """A property as a tensor product Chebyshev series in head location.
+
+    The series is in x and y scaled onto [-1, 1] over the domain of the
+    grid it was fit to, and its max_error is the largest difference from
+    that grid at any of the grid's points. Between the points the grid
+    itself is only as good as its own interpolation, see
+    LookupCrossbridge.error_bound.
+    Use value(h_locs) to evaluate the surrogate
+        gradient(h_locs) for its analytic derivatives
+        save(file_name) to keep its coefficients"""
+
+    def __init__(self, coeffs, x_domain, y_domain, max_error=None):
+        """Set up a surrogate
+        Takes:
+            coeffs: (deg_y + 1, deg_x + 1, k) array of series coefficients
+                for each of the property's k components
+            x_domain, y_domain: (low, high) limits scaled onto [-1, 1]
+            max_error: largest error of the fit over its grid
+        """
+        self.coeffs = np.asarray(coeffs, dtype=float)
+        self.x_domain = tuple(x_domain)
+        self.y_domain = tuple(y_domain)
+        self.max_error = max_error
+
+    def _scale(self, h_locs):
+        """Scale an (N, 2) array of locations onto the series' [-1, 1]"""
+        h_locs = np.asarray(h_locs, dtype=float).reshape(-1, 2)
+        return (_to_unit(h_locs[:, 0], self.x_domain),
+                _to_unit(h_locs[:, 1], self.y_domain))
+
+    def _evaluate(self, coeffs, h_locs):
+        """Evaluate a set of coefficients, as an (N,) or (N, k) array"""
+        (u, v) = self._scale(h_locs)
+        values = np.column_stack([cheb.chebval2d(v, u, coeffs[:, :, i])
+                                  for i in range(coeffs.shape[2])])
+        if coeffs.shape[2] == 1:
+            return values[:, 0]
+        return values
+
+    def value(self, h_locs):
+        """Return the property at an (N, 2) array of head locations"""
+        return self._evaluate(self.coeffs, h_locs)
+
+    def gradient(self, h_locs):
+        """Return the derivatives of the property with respect to x and y at
+        an (N, 2) array of head locations, as an (N, 2) array, or (N, k, 2)
+        for a property with k components"""
+        x_scale = 2.0 / (self.x_domain[1] - self.x_domain[0])
+        y_scale = 2.0 / (self.y_domain[1] - self.y_domain[0])
+        d_x = x_scale * self._evaluate(cheb.chebder(self.coeffs, axis=1),
+                                       h_locs)
+        d_y = y_scale * self._evaluate(cheb.chebder(self.coeffs, axis=0),
+                                       h_locs)
+        return np.stack((d_x, d_y), axis=-1)
+
+    def save(self, file_name):
+        """Save the coefficients, domain and error to an .npz file"""
+        np.savez_compressed(file_name, coeffs=self.coeffs,
+                            x_domain=self.x_domain, y_domain=self.y_domain,
+                            max_error=np.nan if self.max_error is None
+                            else self.max_error)
+
+
+def _to_unit(locs, domain):
+    """Scale locations in a (low, high) domain onto [-1, 1]"""
+    return (2 * locs - domain[0] - domain[1]) / (domain[1] - domain[0])
+
+def load(file_name):
+    """Load a ChebyshevSurrogate saved with ChebyshevSurrogate.save"""
+    saved = np.load(file_name)
+    max_error = float(saved['max_error'])
+    return ChebyshevSurrogate(saved['coeffs'], saved['x_domain'],
+                              saved['y_domain'],
+                              None if np.isnan(max_error) else max_error)
+
+def fit(table, x_locs, y_locs, tol=None, max_deg=40, deg_step=4):
+    """Fit a ChebyshevSurrogate to a grid by least squares
+    Takes:
+        table: (ny, nx) or (ny, nx, k) grid of a property
+        x_locs, y_locs: locations of the grid's columns and rows
+        tol: largest error allowed at any grid point; the degree along both
+            axes is raised deg_step at a time until the fit meets it, or to
+            max_deg if tol is None
+        max_deg: highest degree tried along each axis
+        deg_step: how far to raise the degree each try
+    Returns:
+        surrogate: the lowest degree fit meeting tol, or the max_deg fit if
+            none does (with a warning)
+    """
+    table = np.asarray(table, dtype=float)
+    table = table.reshape(len(y_locs), len(x_locs), -1)
+    x_domain = (float(x_locs[0]), float(x_locs[-1]))
+    y_domain = (float(y_locs[0]), float(y_locs[-1]))
+    (u, v) = (_to_unit(x_locs, x_domain), _to_unit(y_locs, y_domain))
+    if tol is None:
+        degrees = [max_deg]
+    else:
+        degrees = range(deg_step, max_deg, deg_step) + [max_deg]
+    for deg in degrees:
+        deg_x = min(deg, len(x_locs) - 1)
+        deg_y = min(deg, len(y_locs) - 1)
+        vander_x = cheb.chebvander(u, deg_x)
+        vander_y = cheb.chebvander(v, deg_y)
+        # Separable least squares, solving along y and then along x
+        along_y = np.linalg.lstsq(vander_y, table.reshape(len(y_locs), -1),
+                                  rcond=None)[0]
+        along_y = along_y.reshape(deg_y + 1, len(x_locs), -1)
+        coeffs = np.linalg.lstsq(vander_x,
+                                 along_y.transpose(1, 0, 2).reshape(
+                                     len(x_locs), -1), rcond=None)[0]
+        coeffs = coeffs.reshape(deg_x + 1, deg_y + 1, -1).transpose(1, 0, 2)
+        fitted = np.einsum('yi,ijk,xj->yxk', vander_y, coeffs, vander_x)
+        max_error = float(abs(fitted - table).max())
+        if tol is not None and max_error <= tol:
+            break
+    if tol is not None and max_error > tol:
+        warnings.warn("\n Fit errs by " + str(max_error) + " at degree " +
+                      str(max_deg) + ", more than the tolerance " + str(tol))
+    return ChebyshevSurrogate(coeffs, x_domain, y_domain, max_error)
+
+def fit_stored(store, xb_property, rel_tol=1e-3, max_deg=40):
+    """Fit a surrogate to a property in a Storage, to within rel_tol of the
+    property's range"""
+    table = np.asarray(store.get(xb_property), dtype=float)
+    x_locs = np.arange(*store.get('x_range'))
+    y_locs = d10_to_fil_sep(np.arange(*store.get('y_range')))
+    return fit(table, x_locs, y_locs, _tolerance(table, rel_tol), max_deg)
+
+def _tolerance(table, rel_tol):
+    """The error allowed in a fit to a grid, rel_tol of its range"""
+    return rel_tol * float(table.max() - table.min() or 1.0)
+
+
+def main(argv=None):
+    """Parse options and fit the desired properties"""
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hx:t:m:p:",
+                                       ["help", "crossbridge=", "tolerance=",
+                                        "max-degree=", "property="])
+        except getopt.error, msg:
+            raise Usage(msg)
+        # Default values, retained for non-passed options
+        xbtype = 4
+        rel_tol = 1e-3
+        max_deg = 40
+        prop_to_fit = None # Triggers fitting of all grid properties
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(__help_message__)
+            elif option in ("-x", "--crossbridge"):
+                if value in ("1", "2", "4"):
+                    xbtype = int(value)
+                else:
+                    raise Usage("Allowed xb types are 1, 2 and 4 (spring)")
+            elif option in ("-t", "--tolerance"):
+                rel_tol = float(value)
+            elif option in ("-m", "--max-degree"):
+                max_deg = int(value)
+            elif option in ("-p", "--property"):
+                prop_to_fit = value
+        store = Storage.Storage(xbtype)
+        if prop_to_fit is None:
+            shape = (np.arange(*store.get('y_range')).size,
+                     np.arange(*store.get('x_range')).size)
+            props = [prop for prop in sorted(store.list())
+                     if prop not in store.base_attributes + __unsmooth__ and
+                     np.shape(store.get(prop))[:2] == shape]
+        else:
+            props = [prop_to_fit]
+        missed = []
+        for prop in props:
+            surrogate = fit_stored(store, prop, rel_tol, max_deg)
+            summary = (prop + ": degree " +
+                       str(surrogate.coeffs.shape[1] - 1) + " by " +
+                       str(surrogate.coeffs.shape[0] - 1) + ", max error " +
+                       str(surrogate.max_error))
+            if surrogate.max_error > _tolerance(
+                    np.asarray(store.get(prop), dtype=float), rel_tol):
+                print summary + ", over the tolerance, not saved"
+                missed.append(prop)
+                continue
+            surrogate.save(str(xbtype) + "spring." + prop + ".cheb.npz")
+            print summary + ", " + str(surrogate.coeffs.nbytes) + " bytes"
+        if len(missed) > 0:
+            print "Missed the tolerance: " + ", ".join(missed)
+            return 1
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+if __name__ == "__main__":
+    sys.exit(main())